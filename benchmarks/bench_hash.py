@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""文件哈希基准测试
+
+在临时目录中生成若干个大文件，比较旧的4096字节分块哈希、sha256_file和
+sha256_files（多线程）的吞吐量。文件先读一遍进入系统缓存，测试的是哈希本身
+而不是磁盘速度。新的实现比旧实现慢时返回非零退出码。
+
+用法:
+    python benchmarks/bench_hash.py [--files 8] [--size-mb 16] [--repeat 5]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import statistics
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from pass_module import sha256_file, sha256_files
+
+
+def legacy_hash(file_path):
+    """旧的实现：4096字节分块，每块经过一次lambda调用"""
+    sha256_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(chunk)
+    return sha256_hash.hexdigest()
+
+
+def measure(function, repeat):
+    """重复执行，返回耗时中位数（秒）和最后一次的结果"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="文件哈希基准测试")
+    parser.add_argument("--files", type=int, default=8, help="文件个数")
+    parser.add_argument("--size-mb", type=int, default=16, help="每个文件的大小（MiB）")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景的重复次数")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench_hash_") as temp_dir:
+        paths = []
+        for index in range(args.files):
+            path = Path(temp_dir) / f"data{index}.bin"
+            with open(path, 'wb') as f:
+                for _ in range(args.size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            paths.append(path)
+        total_mb = args.files * args.size_mb
+
+        # 预热：让文件进入系统缓存
+        expected = [legacy_hash(path) for path in paths]
+
+        scenarios = [
+            ("legacy 4K", lambda: [legacy_hash(path) for path in paths]),
+            ("sha256_file", lambda: [sha256_file(path) for path in paths]),
+            ("sha256_files", lambda: sha256_files(paths)),
+        ]
+        print(f"{args.files} 个文件 x {args.size_mb} MiB，CPU核心数 {os.cpu_count()}")
+        print(f"{'场景':<16}{'中位数(s)':>12}{'MiB/s':>10}{'加速比':>10}")
+        results = {}
+        failed = False
+        for name, function in scenarios:
+            elapsed, hashes = measure(function, args.repeat)
+            if hashes != expected:
+                print(f"{name:<16}  哈希结果不一致")
+                failed = True
+                continue
+            results[name] = elapsed
+            speedup = results["legacy 4K"] / elapsed
+            print(f"{name:<16}{elapsed:>12.3f}{total_mb / elapsed:>10.0f}{speedup:>9.2f}x")
+
+    if results.get("sha256_file", 0) > results["legacy 4K"]:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
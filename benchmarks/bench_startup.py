@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""启动时间基准测试
+
+在新的解释器进程中多次导入各入口模块，输出导入耗时的中位数，并检查启动时
+不应加载的模块（PyCryptodome、tkinter、multiprocessing、watchdog等）。超出预算或加载了
+不应加载的模块时返回非零退出码，可以用来防止启动速度退化。
+
+用法:
+    python benchmarks/bench_startup.py [--repeat 10] [--budget-ms 150]
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# (名称, 导入语句, 不应在导入时加载的模块)
+SCENARIOS = [
+    ("lib", "import lib",
+     ["Crypto", "tkinter", "multiprocessing", "subprocess", "zipfile", "watchdog"]),
+    ("clean_tools", "import clean_tools",
+     ["Crypto", "tkinter", "multiprocessing", "subprocess", "zipfile", "watchdog"]),
+    ("main", "import main",
+     ["Crypto", "multiprocessing", "subprocess", "zipfile", "winreg", "watchdog"]),
+]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(statement):
+    """在新进程中执行导入，返回(耗时毫秒, 已加载模块列表)"""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(statement=statement)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "导入失败")
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["ms"], data["modules"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动时间基准测试")
+    parser.add_argument("--repeat", type=int, default=10, help="每个场景的重复次数")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="导入耗时中位数上限（毫秒）")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'场景':<14}{'中位数(ms)':>12}{'最小(ms)':>12}  结果")
+    for name, statement, forbidden in SCENARIOS:
+        try:
+            # 第一次运行用于生成字节码缓存，不计入结果
+            measure(statement)
+            samples = []
+            modules = []
+            for _ in range(args.repeat):
+                elapsed, modules = measure(statement)
+                samples.append(elapsed)
+        except RuntimeError as e:
+            print(f"{name:<14}{'-':>12}{'-':>12}  跳过: {e}")
+            continue
+
+        median = statistics.median(samples)
+        loaded = sorted({m.split('.')[0] for m in modules if m.split('.')[0] in forbidden})
+        problems = []
+        if median > args.budget_ms:
+            problems.append(f"超出预算 {args.budget_ms:.0f} ms")
+        if loaded:
+            problems.append(f"启动时加载了 {', '.join(loaded)}")
+        failed = failed or bool(problems)
+        print(f"{name:<14}{median:>12.1f}{min(samples):>12.1f}  {'; '.join(problems) or 'OK'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
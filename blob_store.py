@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import stat
+import uuid
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+
+BLOB_INDEX_VERSION = 2
+
+
+def _make_writable(function, path, excinfo):
+    """rmtree的错误回调：去掉只读属性后重试（Windows上只读文件不能删除）"""
+    os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+    function(path)
+
+
+def remove_tree(path, ignore_errors=False):
+    """删除目录树，包括设为只读的文件"""
+    try:
+        if sys.version_info >= (3, 12):
+            shutil.rmtree(path, onexc=_make_writable)
+        else:
+            shutil.rmtree(path, onerror=_make_writable)
+    except OSError:
+        if not ignore_errors:
+            raise
+
+
+class BlobStore:
+    """按SHA-256寻址的内容存储 - 相同内容的规则文件在存储中只保存一份
+
+    内容保存在root/<前两位>/<sha256>（只读），只在存储内部去重；规则目录中的
+    rule.clean是各自独立的普通文件，可以直接编辑，修改一个规则不会影响其他规则。
+    index.json记录每个写入过的规则文件的(inode, 大小, mtime_ns, 哈希)，stat与之一致
+    时可以直接得到哈希，不必重新读取文件。索引是磁盘上的普通文件，只用于加速：执行前的
+    最后检查直接读取内容。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.index_file = self.root / "index.json"
+        self._blobs = None
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest):
+        return self.root / digest[:2] / digest
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def _load_index(self):
+        """首次使用时读取索引（调用方持有锁）"""
+        self._blobs = {}
+        self._files = {}
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == BLOB_INDEX_VERSION:
+                    self._blobs = {digest: tuple(entry) for digest, entry in data.get('blobs', {}).items()}
+                    self._files = {path: tuple(entry) for path, entry in data.get('files', {}).items()}
+                else:
+                    # 旧版本的索引只记录了内容文件，规则文件的记录从下一次写入开始建立
+                    self._blobs = {digest: tuple(entry) for digest, entry in data.get('blobs', {}).items()}
+            except Exception as e:
+                print(f"读取内容存储索引失败: {e}")
+
+    def _ensure_index(self):
+        if self._blobs is None:
+            self._load_index()
+
+    def _save_index(self):
+        """把索引写回磁盘（调用方持有锁）"""
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            temp_file = self.index_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': BLOB_INDEX_VERSION, 'blobs': self._blobs, 'files': self._files}, f)
+            os.replace(temp_file, self.index_file)
+        except Exception as e:
+            print(f"保存内容存储索引失败: {e}")
+
+    def digest_for(self, path):
+        """规则文件写入后未被修改时返回其SHA-256，否则返回None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._ensure_index()
+            entry = self._files.get(self._key(path))
+        if entry is None or entry[:3] != (st.st_ino, st.st_size, st.st_mtime_ns):
+            return None
+        return entry[3]
+
+    def _store(self, digest, data):
+        """确保内容文件存在且未被修改（调用方持有锁）"""
+        blob = self._blob_path(digest)
+        try:
+            st = os.stat(blob)
+        except FileNotFoundError:
+            st = None
+        if st is not None:
+            # 已有的内容文件总是重新校验，内容不符时重新写入
+            if hashlib.sha256(blob.read_bytes()).hexdigest() == digest:
+                self._blobs[digest] = (st.st_ino, st.st_size, st.st_mtime_ns)
+                return
+            os.chmod(blob, stat.S_IWRITE | stat.S_IREAD)
+            os.unlink(blob)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = blob.with_name(f".{digest}.{uuid.uuid4().hex[:8]}")
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_file, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(temp_file, blob)
+        st = os.stat(blob)
+        self._blobs[digest] = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def write_bytes(self, target, data):
+        """把内容写入目标文件并记录到存储中，返回SHA-256
+
+        先写入旁边的临时文件再改名替换，目标文件总是一个新的独立文件（旧版本留下的
+        硬链接也随之断开）。
+        """
+        target = Path(target)
+        digest = hashlib.sha256(data).hexdigest()
+        temp_file = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}")
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            if os.name == 'nt' and target.exists():
+                # Windows上不能替换只读文件
+                os.chmod(target, stat.S_IWRITE | stat.S_IREAD)
+            os.replace(temp_file, target)
+        except BaseException:
+            try:
+                os.unlink(temp_file)
+            except OSError:
+                pass
+            raise
+        st = os.stat(target)
+        with self._lock:
+            self._ensure_index()
+            self._store(digest, data)
+            self._files[self._key(target)] = (st.st_ino, st.st_size, st.st_mtime_ns, digest)
+            self._save_index()
+        return digest
+
+    def write_text(self, target, text):
+        """按文本模式的换行规则写入文本（与open(target, 'w', encoding='utf-8')的结果相同）"""
+        return self.write_bytes(target, text.replace('\n', os.linesep).encode('utf-8'))
+
+    def adopt(self, path):
+        """把已有文件（例如导入的规则）记录到存储中，返回SHA-256
+
+        文件与其他文件共用inode（旧版本的硬链接）时换成独立的文件。
+        """
+        digest = self.digest_for(path)
+        if digest is not None and os.stat(path).st_nlink == 1:
+            return digest
+        with open(path, 'rb') as f:
+            data = f.read()
+        return self.write_bytes(path, data)
+
+    def detach_links(self, paths):
+        """把仍是内容文件硬链接的规则文件（旧版本的存储方式）换成独立的文件"""
+        for path in paths:
+            try:
+                if os.stat(path).st_nlink > 1:
+                    self.adopt(path)
+            except OSError as e:
+                print(f"断开规则文件链接失败 {path}: {e}")
+
+    def prune(self):
+        """删除已经没有规则文件使用的内容文件
+
+        规则文件已不存在或被修改（stat与记录不同）时移除其记录。
+        """
+        with self._lock:
+            self._ensure_index()
+            changed = False
+            for key, entry in list(self._files.items()):
+                try:
+                    st = os.stat(key)
+                    if entry[:3] == (st.st_ino, st.st_size, st.st_mtime_ns):
+                        continue
+                except OSError:
+                    pass
+                del self._files[key]
+                changed = True
+            used = {entry[3] for entry in self._files.values()}
+            for digest in list(self._blobs):
+                if digest in used:
+                    continue
+                blob = self._blob_path(digest)
+                try:
+                    os.chmod(blob, stat.S_IWRITE | stat.S_IREAD)
+                    os.unlink(blob)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                del self._blobs[digest]
+                changed = True
+            if changed:
+                self._save_index()
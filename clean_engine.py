@@ -0,0 +1,669 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import stat
+import time
+import fnmatch
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def default_worker_count():
+    """默认并发数 - 删除操作以IO为主，线程数可以高于CPU核心数"""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _is_link(entry):
+    """判断目录项是否为符号链接或目录联接，避免清理到目标目录之外"""
+    try:
+        if entry.is_symlink():
+            return True
+        is_junction = getattr(entry, 'is_junction', None)
+        return bool(is_junction and is_junction())
+    except OSError:
+        return True
+
+
+def _remove_dir_link(path):
+    """删除指向目录的符号链接或目录联接本身（Windows上需要用rmdir），不是链接时返回False"""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    reparse_point = getattr(st, 'st_file_attributes', 0) & getattr(stat, 'FILE_ATTRIBUTE_REPARSE_POINT', 0)
+    if not (stat.S_ISLNK(st.st_mode) or reparse_point):
+        return False
+    try:
+        os.rmdir(path)
+        return True
+    except OSError:
+        return False
+
+
+def volume_key(path):
+    """获取路径所在物理卷的标识，路径不存在时向上查找已存在的父目录"""
+    path = os.path.abspath(os.fspath(path))
+    current = path
+    while True:
+        try:
+            return os.stat(current).st_dev
+        except OSError:
+            parent = os.path.dirname(current)
+            if parent == current:
+                break
+            current = parent
+    drive = os.path.splitdrive(path)[0]
+    return drive.upper() if drive else None
+
+
+def path_parts(path):
+    """路径的各级名称（按系统规则规范大小写），用于判断两个路径是否相互包含"""
+    path = os.path.normcase(os.path.abspath(os.fspath(path)))
+    return tuple(part for part in path.split(os.sep) if part)
+
+
+_PERCENT_VAR = re.compile(r'%([^%\\/]+)%')
+_DOLLAR_VAR = re.compile(r'\$(\w+|\{[^}]+\})')
+_SEPARATORS = re.compile(r'[\\/]+')
+# 只有*和?是通配符：Windows路径中常见的方括号（例如App [x86]）按原样匹配
+_MAGIC = re.compile(r'[*?]')
+_UNC_PREFIX = re.compile(r'[\\/]{2}[^\\/]')
+
+
+class PathExpander:
+    """路径展开器 - 展开%VAR%/$VAR环境变量并把*、**通配段解析为实际路径
+
+    每次执行规则创建一个实例：变量展开结果和目录列表都会被缓存，
+    多个规则共享同一父目录时只扫描一次。
+    """
+
+    def __init__(self, environ=None):
+        self.environ = dict(os.environ if environ is None else environ)
+        self._upper_environ = {key.upper(): value for key, value in self.environ.items()}
+        self._flags = re.IGNORECASE if os.name == 'nt' else 0
+        self._expanded = {}
+        self._listings = {}
+        self._subtrees = {}
+        self._patterns = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, name, default):
+        value = self.environ.get(name)
+        if value is None:
+            # Windows环境变量不区分大小写
+            value = self._upper_environ.get(name.upper())
+        return default if value is None else value
+
+    def expand_vars(self, path):
+        """展开%VAR%、$VAR和${VAR}，未定义的变量保持原样"""
+        path = _PERCENT_VAR.sub(lambda m: self._lookup(m.group(1), m.group(0)), path)
+
+        def dollar(match):
+            name = match.group(1)
+            if name.startswith('{'):
+                name = name[1:-1]
+            return self._lookup(name, match.group(0))
+
+        return _DOLLAR_VAR.sub(dollar, path)
+
+    def _listing(self, directory):
+        """列出目录内容 [(名称, 是否目录)]，每个目录只扫描一次"""
+        with self._lock:
+            cached = self._listings.get(directory)
+        if cached is not None:
+            return cached
+
+        entries = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False) and not _is_link(entry)
+                    except OSError:
+                        is_dir = False
+                    entries.append((entry.name, is_dir))
+        except OSError:
+            pass
+        # 排序保证通配符展开结果（以及日志顺序）稳定
+        entries.sort()
+
+        with self._lock:
+            self._listings[directory] = entries
+        return entries
+
+    def _subtree(self, directory):
+        """目录自身及其全部子目录（用于**段）"""
+        with self._lock:
+            cached = self._subtrees.get(directory)
+        if cached is not None:
+            return cached
+
+        result = [directory]
+        for name, is_dir in self._listing(directory):
+            if is_dir:
+                result.extend(self._subtree(os.path.join(directory, name)))
+
+        with self._lock:
+            self._subtrees[directory] = result
+        return result
+
+    def _matcher(self, segment):
+        pattern = self._patterns.get(segment)
+        if pattern is None:
+            pattern = re.compile(fnmatch.translate(segment.replace('[', '[[]')), self._flags)
+            self._patterns[segment] = pattern
+        return pattern
+
+    def expand(self, path):
+        """展开规则路径，返回实际存在的路径列表
+
+        不含通配符的路径原样返回（只展开变量），是否存在由调用方判断。
+        """
+        with self._lock:
+            cached = self._expanded.get(path)
+        if cached is not None:
+            return cached
+
+        expanded = self.expand_vars(path)
+        parts = _SEPARATORS.split(expanded)
+        first_magic = next((i for i, part in enumerate(parts) if _MAGIC.search(part)), None)
+
+        if first_magic is None:
+            result = [expanded]
+        else:
+            base = os.sep.join(parts[:first_magic])
+            if not base:
+                base = os.sep if first_magic > 0 else os.curdir
+            elif base.endswith(':'):
+                base += os.sep
+            elif _UNC_PREFIX.match(expanded):
+                # UNC路径 \\server\share
+                base = os.sep + base
+
+            current = [base]
+            last = len(parts) - 1
+            for index in range(first_magic, len(parts)):
+                part = parts[index]
+                if not part:
+                    continue
+                if part == '**':
+                    candidates = []
+                    for directory in current:
+                        candidates.extend(self._subtree(directory))
+                elif _MAGIC.search(part):
+                    matcher = self._matcher(part)
+                    candidates = [
+                        os.path.join(directory, name)
+                        for directory in current
+                        for name, is_dir in self._listing(directory)
+                        if (is_dir or index == last) and matcher.match(name)
+                    ]
+                else:
+                    candidates = [os.path.join(directory, part) for directory in current]
+                # 去重并保持顺序
+                current = list(dict.fromkeys(candidates))
+                if not current:
+                    break
+
+            result = [candidate for candidate in current if os.path.lexists(candidate)]
+
+        with self._lock:
+            self._expanded[path] = result
+        return result
+
+
+def _compile_globs(patterns, flags):
+    """把多个通配符编译成一个正则；不含/的模式匹配任意层目录中的文件名"""
+    if not patterns:
+        return None
+    parts = []
+    for pattern in patterns:
+        pattern = pattern.replace('\\', '/').strip('/')
+        prefix = '' if '/' in pattern else '(?:.*/)?'
+        parts.append(prefix + fnmatch.translate(pattern))
+    return re.compile('|'.join(f'(?:{part})' for part in parts), flags)
+
+
+class FileFilter:
+    """文件过滤条件 - 规则编译时创建一次，在scandir循环中使用DirEntry已有的stat信息判断
+
+    older_than（秒）：只删除修改时间早于这么久以前的文件；larger_than（字节）：只删除
+    大于这个大小的文件；include/exclude：通配符列表，匹配相对于清理目标的路径（模式中
+    没有/时匹配文件名）。exclude优先于include。
+    """
+    __slots__ = ('older_than', 'larger_than', 'include', 'exclude')
+
+    def __init__(self, older_than=None, larger_than=None, include=(), exclude=()):
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        self.older_than = older_than
+        self.larger_than = larger_than
+        self.include = _compile_globs(include, flags)
+        self.exclude = _compile_globs(exclude, flags)
+
+    def matcher(self, root, now=None):
+        """返回判断函数accept(路径, stat结果)，root为清理目标，now为判断文件年龄的当前时间"""
+        older_than = self.older_than
+        larger_than = self.larger_than
+        include = self.include
+        exclude = self.exclude
+        cutoff = (time.time() if now is None else now) - older_than if older_than is not None else None
+        prefix_length = len(os.path.join(os.fspath(root), ''))
+        convert = os.sep != '/'
+
+        def accept(path, st):
+            if larger_than is not None and st.st_size <= larger_than:
+                return False
+            if cutoff is not None and st.st_mtime > cutoff:
+                return False
+            if include is not None or exclude is not None:
+                relative = path[prefix_length:]
+                if convert:
+                    relative = relative.replace(os.sep, '/')
+                if exclude is not None and exclude.match(relative):
+                    return False
+                if include is not None and not include.match(relative):
+                    return False
+            return True
+
+        return accept
+
+
+class ProgressTracker:
+    """按文件数和字节数加权的清理进度
+
+    有预览扫描结果时用set_expected设置总量；否则总量随目录遍历不断增加（估算）。
+    每条规则行另外计step_weight个单位，保证缺失路径和系统命令也推进进度。
+    进度回调callback(百分比, 已完成文件数, 总文件数)最多每秒max_rate次，且百分比不会回退。
+    可以在多个线程中同时调用。
+    """
+
+    def __init__(self, callback, total_steps=0, max_rate=20, step_weight=1.0, bytes_per_unit=1024 * 1024):
+        self.callback = callback
+        self.total_steps = total_steps
+        self.min_interval = 1.0 / max_rate
+        self.step_weight = step_weight
+        self.bytes_per_unit = bytes_per_unit
+        self.expected = False
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_files = 0
+        self.done_bytes = 0
+        self.done_steps = 0
+        self._percent = 0
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+
+    def set_expected(self, files, total_bytes):
+        """使用预览扫描得到的总量，之后discover不再增加总量"""
+        with self._lock:
+            self.expected = True
+            self.total_files = files
+            self.total_bytes = total_bytes
+
+    def discover(self, files, total_bytes):
+        """遍历目录时发现了新的文件（没有预览结果时用于估算总量）"""
+        with self._lock:
+            if not self.expected:
+                self.total_files += files
+                self.total_bytes += total_bytes
+        self._emit()
+
+    def advance(self, files, total_bytes):
+        """已处理（删除或删除失败）的文件"""
+        with self._lock:
+            self.done_files += files
+            self.done_bytes += total_bytes
+            if not self.expected:
+                # 估算模式下总量至少等于已完成的量
+                self.total_files = max(self.total_files, self.done_files)
+                self.total_bytes = max(self.total_bytes, self.done_bytes)
+        self._emit()
+
+    def step_done(self):
+        """一条规则行执行完毕"""
+        with self._lock:
+            self.done_steps += 1
+        self._emit()
+
+    def finish(self):
+        """立即发出最后一次进度"""
+        self._emit(force=True)
+
+    def _fraction(self):
+        def units(files, size, steps):
+            return files + size / self.bytes_per_unit + steps * self.step_weight
+
+        total = units(self.total_files, self.total_bytes, self.total_steps)
+        if total <= 0:
+            return 0.0
+        done = units(min(self.done_files, self.total_files), min(self.done_bytes, self.total_bytes),
+                     min(self.done_steps, self.total_steps))
+        return min(done / total, 1.0)
+
+    def _emit(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_emit < self.min_interval:
+                return
+            self._last_emit = now
+            self._percent = max(self._percent, int(self._fraction() * 100))
+            args = (self._percent, self.done_files, self.total_files)
+        self.callback(*args)
+
+
+class VolumeScheduler:
+    """按物理卷限制并发的任务调度器 - 不同卷上的任务同时执行，结果按提交顺序回调"""
+
+    def __init__(self, per_volume=2):
+        self.per_volume = max(1, int(per_volume))
+
+    def run(self, jobs, on_result, cancel_event=None):
+        """执行任务
+
+        jobs为(卷标识, 无参函数)列表；on_result(index, result)在调用线程中
+        按jobs的顺序依次回调，保证日志顺序确定。取消时未执行的任务没有回调，
+        已完成的任务仍按顺序回调（跳过未执行的下标）。
+        """
+        if not jobs:
+            return
+
+        queues = defaultdict(deque)
+        for index, (volume, _) in enumerate(jobs):
+            queues[volume].append(index)
+        running = defaultdict(int)
+        pool_size = sum(min(self.per_volume, len(q)) for q in queues.values())
+
+        with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="clean-target") as executor:
+            futures = {}
+            results = {}
+            next_index = 0
+
+            def fill():
+                for volume, q in queues.items():
+                    while q and running[volume] < self.per_volume:
+                        if cancel_event is not None and cancel_event.is_set():
+                            q.clear()
+                            break
+                        index = q.popleft()
+                        futures[executor.submit(jobs[index][1])] = (index, volume)
+                        running[volume] += 1
+
+            fill()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, volume = futures.pop(future)
+                    running[volume] -= 1
+                    results[index] = future.result()
+                while next_index in results:
+                    on_result(next_index, results.pop(next_index))
+                    next_index += 1
+                fill()
+
+            # 取消后队列被清空，排在空缺之后的已完成结果也要回调
+            for index in sorted(results):
+                on_result(index, results[index])
+
+
+class DeletionEngine:
+    """并行删除引擎 - 使用os.scandir遍历目录，并将删除操作分发到有界线程池"""
+
+    def __init__(self, max_workers=None, batch_size=256):
+        self.max_workers = max(1, int(max_workers or default_worker_count()))
+        self.batch_size = batch_size
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """延迟创建线程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="clean-worker"
+                )
+            return self._executor
+
+    def shutdown(self):
+        """关闭线程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _scan_directory(self, path, include_links=False, accept=None):
+        """扫描单个目录，利用DirEntry缓存的类型和大小信息区分文件和子目录
+
+        include_links=True时（删除整个目录）把指向目录的链接、失效的链接等其他条目也当作
+        大小为0的文件返回，删除时只删除链接本身。accept为FileFilter.matcher返回的判断函数，
+        使用取大小时已有的stat结果判断，不符合条件的文件保留并计入filtered。
+        返回(文件, 大小, 子目录, 保留的文件数, 错误数)。
+        """
+        files = []
+        sizes = []
+        subdirs = []
+        filtered = 0
+        errors = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        st = None
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _is_link(entry):
+                                subdirs.append(entry.path)
+                                continue
+                            if not include_links:
+                                continue
+                            size = 0
+                        elif entry.is_file():
+                            st = entry.stat(follow_symlinks=False)
+                            size = st.st_size
+                        elif include_links:
+                            size = 0
+                        else:
+                            continue
+                        if accept is not None:
+                            if not accept(entry.path, st or entry.stat(follow_symlinks=False)):
+                                filtered += 1
+                                continue
+                        sizes.append(size)
+                        files.append(entry.path)
+                    except OSError:
+                        errors += 1
+        except OSError:
+            errors += 1
+        return files, sizes, subdirs, filtered, errors
+
+    def _visit_directory(self, path, include_links=False, journal=None, accept=None):
+        """扫描目录；有目录日志且目录mtime未变化时跳过scandir，直接使用记录的子目录
+
+        返回(文件, 大小, 子目录, 保留的文件数, 错误数, 扫描前的mtime_ns, 是否跳过)。
+        """
+        if journal is None:
+            return self._scan_directory(path, include_links, accept) + (None, False)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], [], [], 0, 1, None, False
+        subdirs = journal.unchanged_subdirs(path, mtime_ns)
+        if subdirs is not None:
+            return [], [], subdirs, 0, 0, mtime_ns, True
+        return self._scan_directory(path, include_links, accept) + (mtime_ns, False)
+
+    def _unlink_batch(self, paths, cancel_event=None, sizes=None):
+        """删除一批文件，每个文件之间检查取消标志，返回(已删除, 失败, 释放字节数)"""
+        deleted = 0
+        failed = 0
+        freed = 0
+        for index, path in enumerate(paths):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                if not _remove_dir_link(path):
+                    failed += 1
+                    continue
+            deleted += 1
+            if sizes is not None:
+                freed += sizes[index]
+        return deleted, failed, freed
+
+    def _process_tree(self, root, cancel_event=None, delete=True, collect=None, collect_sizes=None,
+                      progress=None, mode='files', collect_dirs=None, journal=None, file_filter=None):
+        """并行遍历目录树
+
+        delete=True时把文件分批交给线程池删除；collect/collect_sizes为列表时收集文件路径
+        和大小（预览扫描），collect_dirs为列表时收集遍历到的目录。设置cancel_event后不再
+        提交新任务，已开始的批次在当前文件处停止。
+        mode为'prune'或'tree'且delete=True时按后序删除目录：一个目录的文件删除完、
+        子目录都处理完后立即rmdir（非空时保留）；'tree'还会删除root本身。取消后不再删除目录。
+        journal为DirectoryJournal时跳过mtime未变化的空目录的scandir，并记录本次没有文件的目录。
+        file_filter为FileFilter时只处理符合条件的文件，其余文件保留。
+        stats中bytes为遍历到的文件总大小，freed为实际删除的字节数，dirs_removed为删除的目录数，
+        dirs_skipped为按目录日志跳过扫描的目录数，filtered为按过滤条件保留的文件数。
+        progress为ProgressTracker时报告发现和删除的文件。
+        """
+        stats = {'files': 0, 'deleted': 0, 'failed': 0, 'dirs': 0, 'bytes': 0, 'freed': 0, 'dirs_removed': 0,
+                 'dirs_skipped': 0, 'filtered': 0}
+        executor = self._get_executor()
+        root = os.fspath(root)
+        accept = file_filter.matcher(root) if file_filter is not None else None
+        remove_dirs = delete and mode in ('prune', 'tree')
+        include_links = mode == 'tree'
+        # 目录 -> [父目录, 未完成的子任务数]（子目录和删除批次）
+        remaining = {}
+
+        def directory_done(directory):
+            # 后序：子目录先于父目录删除
+            while directory is not None:
+                parent = remaining.pop(directory)[0]
+                if directory != root or mode == 'tree':
+                    try:
+                        os.rmdir(directory)
+                        stats['dirs_removed'] += 1
+                    except OSError:
+                        pass
+                if parent is None:
+                    break
+                remaining[parent][1] -= 1
+                if remaining[parent][1] > 0:
+                    break
+                directory = parent
+
+        pending = {executor.submit(self._visit_directory, root, include_links, journal, accept): ('scan', root, None)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            for future in done:
+                kind, directory, parent = pending.pop(future)
+                if future.cancelled():
+                    continue
+                if kind == 'scan':
+                    if cancelled:
+                        continue
+                    files, sizes, subdirs, filtered, errors, mtime_ns, skipped = future.result()
+                    stats['dirs'] += 1
+                    stats['filtered'] += filtered
+                    if skipped:
+                        stats['dirs_skipped'] += 1
+                    elif journal is not None and mtime_ns is not None and not (files or filtered or errors):
+                        # 保留的文件以后可能符合条件（例如变旧），有保留文件的目录不能跳过
+                        journal.record(directory, mtime_ns, subdirs)
+                    stats['files'] += len(files)
+                    stats['failed'] += errors
+                    stats['bytes'] += sum(sizes)
+                    if collect is not None:
+                        collect.extend(files)
+                    if collect_sizes is not None:
+                        collect_sizes.extend(sizes)
+                    if collect_dirs is not None:
+                        collect_dirs.append(directory)
+                    if progress is not None and delete:
+                        progress.discover(len(files), sum(sizes))
+                    for subdir in subdirs:
+                        pending[executor.submit(self._visit_directory, subdir, include_links, journal, accept)] = \
+                            ('scan', subdir, directory)
+                    batches = 0
+                    if delete:
+                        for i in range(0, len(files), self.batch_size):
+                            pending[executor.submit(self._unlink_batch, files[i:i + self.batch_size],
+                                                    cancel_event, sizes[i:i + self.batch_size])] = \
+                                ('unlink', directory, None)
+                            batches += 1
+                    if remove_dirs:
+                        remaining[directory] = [parent, len(subdirs) + batches]
+                        if len(subdirs) + batches == 0:
+                            directory_done(directory)
+                else:
+                    deleted, failed, freed = future.result()
+                    stats['deleted'] += deleted
+                    stats['failed'] += failed
+                    stats['freed'] += freed
+                    if progress is not None:
+                        progress.advance(deleted + failed, freed)
+                    if remove_dirs and not cancelled:
+                        remaining[directory][1] -= 1
+                        if remaining[directory][1] == 0:
+                            directory_done(directory)
+            if cancelled:
+                # 取消尚未开始的任务
+                for future in pending:
+                    future.cancel()
+
+        return stats
+
+    def clean_directory(self, root, cancel_event=None, progress=None, mode='files', journal=None,
+                        file_filter=None):
+        """删除目录中的文件：mode为'files'时保留目录结构，'prune'时删除变空的子目录，'tree'时删除整个目录"""
+        return self._process_tree(root, cancel_event, progress=progress, mode=mode, journal=journal,
+                                  file_filter=file_filter)
+
+    def scan_directory(self, root, cancel_event=None, mode='files', journal=None, file_filter=None):
+        """预览扫描：只统计不删除，返回(统计信息, 文件列表, 文件大小列表, 目录列表)
+
+        mode为'tree'时文件列表中也包括目录中的链接，删除时只删除链接本身。
+        """
+        files = []
+        sizes = []
+        dirs = []
+        stats = self._process_tree(root, cancel_event, delete=False, collect=files, collect_sizes=sizes,
+                                   mode=mode, collect_dirs=dirs, journal=journal, file_filter=file_filter)
+        return stats, files, sizes, dirs
+
+    @staticmethod
+    def remove_empty_dirs(dirs, keep=None):
+        """从最深的目录开始删除空目录（按预览清单删除文件之后使用），keep为要保留的目录，返回删除的目录数"""
+        removed = 0
+        for directory in sorted(dirs, key=lambda d: d.count(os.sep), reverse=True):
+            if directory == keep:
+                continue
+            try:
+                os.rmdir(directory)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def delete_files(self, paths, cancel_event=None, sizes=None, progress=None):
+        """按清单删除文件（复用预览扫描结果，不再遍历目录）"""
+        stats = {'files': len(paths), 'deleted': 0, 'failed': 0, 'dirs': 0,
+                 'bytes': sum(sizes) if sizes else 0, 'freed': 0, 'dirs_removed': 0, 'dirs_skipped': 0,
+                 'filtered': 0}
+        executor = self._get_executor()
+        futures = [
+            executor.submit(self._unlink_batch, paths[i:i + self.batch_size], cancel_event,
+                            sizes[i:i + self.batch_size] if sizes else None)
+            for i in range(0, len(paths), self.batch_size)
+        ]
+        for future in futures:
+            deleted, failed, freed = future.result()
+            stats['deleted'] += deleted
+            stats['failed'] += failed
+            stats['freed'] += freed
+            if progress is not None:
+                progress.advance(deleted + failed, freed)
+        return stats
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""命令行清理工具（不依赖tkinter）
+
+用法:
+    python -m clean_tools list
+    python -m clean_tools run <规则名> [--workers N] [--per-volume N] [--max-commands N] [--rotate-logs]
+                              [--dry-run] [--json]
+    python -m clean_tools export <规则包.zip> [规则名 ...]
+    python -m clean_tools import <规则包.zip> [--policy skip|overwrite|keep-newer]
+    python -m clean_tools history [--rule 规则名] [--run-id ID] [--type run|target] [--since 时间]
+                                  [--grep 文本] [--limit N] [--json]
+"""
+
+import sys
+import json
+import time
+import argparse
+import datetime
+import threading
+from pathlib import Path
+from collections import deque
+
+from lib import CleanToolsCore, format_size
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BLOCKED = 2
+EXIT_CANCELLED = 130
+
+SECURITY_MESSAGES = {
+    'tampered': "规则文件已被篡改",
+    'cannot_verify': "无法验证规则完整性",
+    'tampered_before_execution': "执行前检测到规则文件被篡改",
+    'verification_exception': "完整性验证出错",
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="clean_tools", description="CleanTools 命令行清理工具")
+    parser.add_argument("--program-path", default=str(Path(__file__).parent),
+                        help="程序目录（包含rule和logs目录）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="列出所有规则")
+    list_parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+
+    run_parser = subparsers.add_parser("run", help="执行清理规则")
+    run_parser.add_argument("rule", help="规则名称或规则目录名")
+    run_parser.add_argument("--workers", type=int, default=None, help="删除线程数（默认按CPU核心数计算）")
+    run_parser.add_argument("--per-volume", type=int, default=2, help="同一物理卷上同时清理的目标数")
+    run_parser.add_argument("--max-commands", type=int, default=None,
+                            help="同时执行的system[parallel]命令数（默认4）")
+    run_parser.add_argument("--rotate-logs", action="store_true", default=None,
+                            help="本次运行开始新的日志分段（默认使用config.json中的rotate_logs_each_run）")
+    run_parser.add_argument("--dry-run", action="store_true", help="只做预览扫描，不删除任何文件")
+    run_parser.add_argument("--json", action="store_true", help="以JSON格式输出运行汇总（日志输出到标准错误）")
+    
+    export_parser = subparsers.add_parser("export", help="导出规则包")
+    export_parser.add_argument("output", help="规则包文件路径（.zip）")
+    export_parser.add_argument("rules", nargs="*", help="规则名称或规则目录名（默认全部规则）")
+    
+    import_parser = subparsers.add_parser("import", help="导入规则包")
+    import_parser.add_argument("pack", help="规则包或规则压缩包路径")
+    import_parser.add_argument("--policy", choices=("skip", "overwrite", "keep-newer"), default="skip",
+                               help="规则已存在且内容不同时的处理方式")
+    
+    history_parser = subparsers.add_parser("history", help="查看清理运行记录")
+    history_parser.add_argument("--rule", default=None, help="只显示该规则的记录")
+    history_parser.add_argument("--run-id", default=None, help="只显示该次运行的记录")
+    history_parser.add_argument("--type", choices=("run", "target"), default=None, dest="record_type",
+                                help="记录类型：run为每次运行的汇总，target为每个清理目标（默认全部）")
+    history_parser.add_argument("--since", type=since_time, default=None,
+                                help="只显示该时间之后的记录（ISO格式，例如2024-05-01或2024-05-01T08:00）")
+    history_parser.add_argument("--grep", default=None, help="只显示规则名或目标路径中包含该文本的记录（不区分大小写）")
+    history_parser.add_argument("--limit", type=int, default=None, help="只显示最后N条记录")
+    history_parser.add_argument("--json", action="store_true", help="以JSON Lines格式输出")
+    return parser
+
+
+def since_time(value):
+    """--since参数：解析ISO格式时间，统一为运行记录中的时间格式"""
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat(timespec='seconds')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间: {value}")
+
+
+def find_rule(core, name):
+    """按规则名称或目录名查找规则，找不到时返回None"""
+    rules_data = core.load_rules(defer_verification=True)
+    rule_info = rules_data.get(name)
+    if rule_info is None:
+        rule_info = next((info for info in rules_data.values() if info['rule_dir'].name == name), None)
+    if rule_info is not None and rule_info.get('integrity_status') == 'pending':
+        # 只验证要执行的规则
+        rule_info = core.load_rule(rule_info['rule_dir'])
+    return rule_info
+
+
+def command_list(core, args):
+    rules_data = core.load_rules(defer_verification=True)
+    if args.json:
+        rules = [{
+            'name': name,
+            'dir': info['rule_dir'].name,
+            'version': info.get('version', ''),
+            'encrypted': info.get('is_encrypted', False),
+            'integrity': info.get('integrity_status')
+        } for name, info in rules_data.items()]
+        print(json.dumps(rules, ensure_ascii=False, indent=2))
+    else:
+        for name, info in rules_data.items():
+            marker = " 🔒" if info.get('is_encrypted', False) else ""
+            print(f"{name}{marker}  ({info['rule_dir'].name})")
+    return EXIT_OK
+
+
+def command_export(core, args):
+    rules_data = core.load_rules(defer_verification=True)
+    if args.rules:
+        selected = []
+        for name in args.rules:
+            rule_info = rules_data.get(name) or next(
+                (info for info in rules_data.values() if info['rule_dir'].name == name), None)
+            if rule_info is None:
+                print(f"规则不存在: {name}", file=sys.stderr)
+                return EXIT_FAILED
+            selected.append(rule_info)
+    else:
+        selected = list(rules_data.values())
+    
+    count = core.export_rules(selected, args.output)
+    if not count:
+        return EXIT_FAILED
+    print(f"已导出 {count} 个规则到 {args.output}")
+    return EXIT_OK
+
+
+def command_import(core, args):
+    result = core.import_rule(args.pack, args.policy)
+    if result is None:
+        return EXIT_FAILED
+    for key, label in (('imported', "导入"), ('unchanged', "未变化"), ('skipped', "跳过")):
+        for name in result[key]:
+            print(f"{label}: {name}")
+    return EXIT_FAILED if result['failed'] else EXIT_OK
+
+
+def format_record(record):
+    """运行记录的单行文本"""
+    prefix = f"{record.get('time', '')}  {record.get('run_id', '')}  {record.get('rule', '')}"
+    if record.get('type') == 'target':
+        return (f"{prefix}  {record.get('target', '')}  删除 {record.get('deleted', 0)}/{record.get('files', 0)}"
+                f"  失败 {record.get('failed', 0)}  释放 {format_size(record.get('bytes_freed', 0))}"
+                f"  {record.get('duration', 0):.1f} 秒")
+    return (f"{prefix}  {record.get('status', '')}  目标 {record.get('targets', 0)}"
+            f"  释放 {format_size(record.get('bytes_freed', 0))}  {record.get('duration', 0):.1f} 秒")
+
+
+def command_history(core, args):
+    records = core.log_store.search_runs(rule=args.rule, run_id=args.run_id, record_type=args.record_type,
+                                         since=args.since)
+    if args.grep:
+        needle = args.grep.lower()
+        records = (record for record in records
+                   if needle in record.get('rule', '').lower() or needle in record.get('target', '').lower())
+    if args.limit is not None:
+        records = deque(records, maxlen=max(0, args.limit))
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False) if args.json else format_record(record))
+    return EXIT_OK
+
+
+def command_run(core, args):
+    out = sys.stderr if args.json else sys.stdout
+
+    def log(message):
+        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        log_message = f"[{timestamp}] {message}\n"
+        out.write(log_message)
+        out.flush()
+        if not args.dry_run:
+            core.write_log(log_message)
+
+    rule_info = find_rule(core, args.rule)
+    if rule_info is None:
+        log(f"规则不存在: {args.rule}")
+        return EXIT_FAILED
+
+    summary = {
+        'rule': rule_info['Name'],
+        'mode': 'dry-run' if args.dry_run else 'clean',
+        'status': 'failed',
+        'targets': 0,
+        'files': 0,
+        'bytes': 0,
+        'duration': 0.0
+    }
+
+    if not args.dry_run:
+        reason, details = core.check_rule_security(rule_info)
+        if reason is not None:
+            log(f"[安全阻止] {SECURITY_MESSAGES[reason]}: {rule_info['Name']} - {details}")
+            summary['status'] = 'blocked'
+            summary['reason'] = reason
+            if args.json:
+                print(json.dumps(summary, ensure_ascii=False))
+            return EXIT_BLOCKED
+
+    cancel_event = threading.Event()
+    result = {}
+
+    summary_lock = threading.Lock()
+
+    def on_target(target, stats):
+        # 在清理线程中回调，多个目标可能同时完成
+        with summary_lock:
+            summary['targets'] += 1
+            summary['files'] += stats['deleted']
+            summary['bytes'] += stats['freed']
+
+    def run():
+        if args.dry_run:
+            result['value'] = core.scan_rule(rule_info, log, cancel_event=cancel_event)
+        else:
+            result['value'] = core.execute_clean_rule(rule_info, log, cancel_event=cancel_event,
+                                                      stats_callback=on_target)
+
+    started = time.monotonic()
+    worker = threading.Thread(target=run, name="clean-task")
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.2)
+    except KeyboardInterrupt:
+        log("正在取消...")
+        cancel_event.set()
+        worker.join()
+    summary['duration'] = round(time.monotonic() - started, 3)
+
+    value = result.get('value')
+    if args.dry_run and value is not None:
+        summary['targets'] = sum(len(entries) for entries in value['targets'].values())
+        summary['files'] = value['total_files']
+        summary['bytes'] = value['total_bytes']
+
+    if cancel_event.is_set():
+        summary['status'] = 'cancelled'
+        exit_code = EXIT_CANCELLED
+    elif value:
+        summary['status'] = 'completed'
+        exit_code = EXIT_OK
+    else:
+        exit_code = EXIT_FAILED
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False))
+    elif summary['status'] == 'completed' and not args.dry_run:
+        log(f"清理完成: 删除 {summary['files']} 个文件, 释放 {format_size(summary['bytes'])}, "
+            f"耗时 {summary['duration']:.1f} 秒")
+    return exit_code
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    core = CleanToolsCore(args.program_path,
+                          max_workers=getattr(args, 'workers', None),
+                          per_volume_workers=getattr(args, 'per_volume', 2),
+                          max_commands=getattr(args, 'max_commands', None),
+                          rotate_logs_each_run=getattr(args, 'rotate_logs', None))
+    try:
+        if args.command == "list":
+            return command_list(core, args)
+        if args.command == "export":
+            return command_export(core, args)
+        if args.command == "import":
+            return command_import(core, args)
+        if args.command == "history":
+            return command_history(core, args)
+        return command_run(core, args)
+    finally:
+        core.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
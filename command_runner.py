@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import signal
+import locale
+import asyncio
+from collections import deque
+
+# 同时运行的命令数上限
+DEFAULT_CONCURRENCY = 4
+# 检查取消标志的间隔（秒）
+POLL_INTERVAL = 0.2
+# 进程结束后等待输出读完的时间（秒）：子进程留下的后台进程可能一直占用管道
+DRAIN_TIMEOUT = 2.0
+
+# 输出捕获的内存上限：管道缓冲、单行长度、每个命令直接写入日志的行数和之后保留的末尾行数
+STREAM_LIMIT = 64 * 1024
+MAX_LINE_BYTES = 4096
+MAX_LOGGED_LINES = 500
+TAIL_LINES = 100
+
+
+class OutputCapture:
+    """单个输出流的有界捕获 - 按行写入日志，内存占用与输出总量无关
+
+    超长的行截断；回车（\r）后的内容覆盖当前行，进度条只保留最后的状态。前max_lines行
+    立即写入日志，之后只在环形缓冲中保留最后tail_lines行，结束时写入日志并注明省略的
+    行数。命令超时被结束时也会写出已收到的内容。
+    """
+
+    def __init__(self, prefix, log, encoding, max_lines=MAX_LOGGED_LINES, tail_lines=TAIL_LINES,
+                 max_line_bytes=MAX_LINE_BYTES):
+        self.prefix = prefix
+        self.log = log
+        self.encoding = encoding
+        self.max_lines = max_lines
+        self.max_line_bytes = max_line_bytes
+        self.tail = deque(maxlen=tail_lines)
+        self.pending = bytearray()
+        self.truncated = 0
+        self.carriage = False
+        self.lines = 0
+        self.omitted = 0
+
+    def feed(self, data):
+        """处理读到的一块输出"""
+        for index, segment in enumerate(data.split(b'\n')):
+            if index:
+                self._emit()
+            self._append(segment)
+
+    def _discard(self):
+        self.pending.clear()
+        self.truncated = 0
+
+    def _append(self, segment):
+        if not segment:
+            return
+        if self.carriage:
+            self._discard()
+        # 行尾的\r可能是\r\n被拆到了两块中，等看到下一块再决定是否覆盖
+        self.carriage = segment.endswith(b'\r')
+        if self.carriage:
+            segment = segment[:-1]
+        if b'\r' in segment:
+            self._discard()
+            segment = segment.rpartition(b'\r')[2]
+        room = max(0, self.max_line_bytes - len(self.pending))
+        if len(segment) > room:
+            self.truncated += len(segment) - room
+            segment = segment[:room]
+        self.pending += segment
+
+    def _emit(self):
+        """当前行结束"""
+        text = self.pending.decode(self.encoding, errors='replace').rstrip()
+        if self.truncated:
+            text += f" ...（截断了 {self.truncated} 字节）"
+        self._discard()
+        self.carriage = False
+        if not text:
+            return
+        self.lines += 1
+        if self.lines <= self.max_lines:
+            self.log(f"{self.prefix}: {text}")
+            return
+        if len(self.tail) == self.tail.maxlen:
+            self.omitted += 1
+        self.tail.append(text)
+
+    def close(self):
+        """输出结束（或命令被结束）：写出未完成的行和保留的末尾行"""
+        if self.pending or self.truncated:
+            self._emit()
+        if self.omitted:
+            self.log(f"{self.prefix}: ...（省略了 {self.omitted} 行）")
+        while self.tail:
+            self.log(f"{self.prefix}: {self.tail.popleft()}")
+        self.omitted = 0
+
+
+async def _pump(stream, capture):
+    """按块读取输出交给capture；读取被取消时也写出已收到的内容"""
+    try:
+        while True:
+            data = await stream.read(STREAM_LIMIT)
+            if not data:
+                break
+            capture.feed(data)
+    finally:
+        capture.close()
+
+
+async def _kill_tree(process):
+    """结束命令及其子进程（shell=True时直接kill只会结束shell本身）"""
+    if process.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            killer = await asyncio.create_subprocess_exec(
+                'taskkill', '/F', '/T', '/PID', str(process.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            await killer.wait()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class CommandRunner:
+    """系统命令执行器 - 在asyncio事件循环中运行一组命令
+
+    输出按行边读边写入日志，不等命令结束，每个输出流的内存占用有上限（见OutputCapture）；
+    每个命令有自己的超时，超时或取消时结束整个进程树，已输出的内容保留在日志中。
+    同时运行的命令数不超过max_concurrency。
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency or DEFAULT_CONCURRENCY)
+        self.encoding = locale.getpreferredencoding(False)
+
+    def run(self, commands, log_callback=None, cancel_event=None):
+        """执行一组命令并等待全部结束
+
+        commands为[(日志前缀, 命令, 超时秒数)]，超时为None时不限时间。
+        返回每个命令的结果{'command', 'status', 'returncode', 'duration', 'lines'}，lines为输出行数，
+        status为'success'、'failed'、'timeout'、'cancelled'或'error'。
+        """
+        if not commands:
+            return []
+        return asyncio.run(self._run_all(commands, log_callback, cancel_event))
+
+    async def _run_all(self, commands, log_callback, cancel_event):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(*(
+            self._run_one(semaphore, prefix, command, timeout, log_callback, cancel_event)
+            for prefix, command, timeout in commands
+        ))
+
+    async def _run_one(self, semaphore, prefix, command, timeout, log_callback, cancel_event):
+        def log(message):
+            if log_callback:
+                log_callback(f"{prefix}{message}")
+
+        result = {'command': command, 'status': 'cancelled', 'returncode': None, 'duration': 0.0, 'lines': 0}
+        async with semaphore:
+            if cancel_event is not None and cancel_event.is_set():
+                return result
+
+            log(f"执行命令: {command}")
+            started = time.monotonic()
+            try:
+                process = await asyncio.create_subprocess_shell(
+                    command,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    limit=STREAM_LIMIT,
+                    # 单独的进程组，超时时可以结束shell启动的所有进程
+                    start_new_session=os.name != 'nt'
+                )
+            except Exception as e:
+                log(f"执行命令失败 {command}: {str(e)}")
+                result['status'] = 'error'
+                return result
+
+            captures = [OutputCapture("输出", log, self.encoding), OutputCapture("错误", log, self.encoding)]
+            readers = [
+                asyncio.ensure_future(_pump(process.stdout, captures[0])),
+                asyncio.ensure_future(_pump(process.stderr, captures[1])),
+            ]
+            status = await self._wait(process, timeout, cancel_event)
+            if status != 'exited':
+                await _kill_tree(process)
+                await process.wait()
+            _, pending = await asyncio.wait(readers, timeout=DRAIN_TIMEOUT)
+            for reader in pending:
+                reader.cancel()
+            # 等待被取消的读取写出已收到的内容，超时提示排在输出之后
+            await asyncio.gather(*readers, return_exceptions=True)
+
+            result['lines'] = sum(capture.lines for capture in captures)
+            result['returncode'] = process.returncode
+            result['duration'] = round(time.monotonic() - started, 3)
+            if status == 'timeout':
+                result['status'] = 'timeout'
+                log(f"命令执行超时（{timeout:g} 秒）: {command}")
+            elif status == 'cancelled':
+                log(f"命令已取消: {command}")
+            elif process.returncode == 0:
+                result['status'] = 'success'
+                log("命令执行成功")
+            else:
+                result['status'] = 'failed'
+                log(f"命令执行失败，返回码: {process.returncode}")
+        return result
+
+    @staticmethod
+    async def _wait(process, timeout, cancel_event):
+        """等待进程结束，返回'exited'、'timeout'或'cancelled'"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        waiter = asyncio.ensure_future(process.wait())
+        try:
+            while True:
+                interval = POLL_INTERVAL
+                if deadline is not None:
+                    interval = min(interval, max(0.0, deadline - time.monotonic()))
+                done, _ = await asyncio.wait({waiter}, timeout=interval)
+                if done:
+                    return 'exited'
+                if cancel_event is not None and cancel_event.is_set():
+                    return 'cancelled'
+                if deadline is not None and time.monotonic() >= deadline:
+                    return 'timeout'
+        finally:
+            if not waiter.done():
+                waiter.cancel()
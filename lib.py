@@ -4,24 +4,170 @@ import os
 import sys
 import shutil
 import json
-import zipfile
-import tempfile
-import subprocess
 import datetime
+import time
+import queue
+import threading
 from pathlib import Path
-from tkinter import messagebox
-from pass_module import SecurityManager
+from concurrent.futures import Future
+from pass_module import SecurityManager, verify_rule_worker
+from clean_engine import DeletionEngine, VolumeScheduler, PathExpander, ProgressTracker, volume_key, path_parts
+from rule_compiler import RuleCache, DEFAULT_COMMAND_TIMEOUT
+from rule_catalog import RuleCatalog, RuleWatcher
+from log_store import LogStore
+from blob_store import BlobStore, remove_tree
+from target_journal import TargetJournal
+
+def format_size(size):
+    """格式化字节数"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+
+class TargetLog(str):
+    """单个清理目标的结果日志 - 界面的摘要模式按类型而不是日志文字过滤这些消息"""
+    __slots__ = ()
+
+
+class RunContext:
+    """单次规则执行（或预览扫描）共享的状态"""
+    
+    def __init__(self, cancel_event=None, manifest=None, recorder=None, progress=None):
+        self.cancel_event = cancel_event
+        self.manifest = manifest
+        # 按文件数和字节数计算的进度（ProgressTracker），可以为None
+        self.progress = progress
+        # 本次运行共享的路径展开器（缓存变量展开和目录扫描结果）
+        self.expander = PathExpander()
+        # 每个目标清理完成后调用recorder(目标, 统计信息, 耗时)
+        self.recorder = recorder
+        self.targets = 0
+        self.bytes_freed = 0
+        self._lock = threading.Lock()
+    
+    def record_target(self, target, stats, duration):
+        """记录单个目标的清理结果（多个目标可能同时完成）"""
+        with self._lock:
+            self.targets += 1
+            self.bytes_freed += stats['freed']
+        if self.recorder:
+            self.recorder(target, stats, duration)
+    
+    def cancelled(self):
+        """是否已请求取消"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def manifest_entries(self, operation):
+        """获取预览清单中该规则行对应的条目，没有清单时返回None"""
+        if self.manifest is None:
+            return None
+        return self.manifest['targets'].get(operation.line_no)
+
+
+def print_notification(level, title, message):
+    """默认的提示方式（无界面时输出到标准错误）"""
+    print(f"[{title}] {message}", file=sys.stderr)
+
 
 class CleanToolsCore:
-    def __init__(self, program_path):
+    def __init__(self, program_path, max_workers=None, per_volume_workers=2, notify=None, max_commands=None,
+                 rotate_logs_each_run=None):
         self.program_path = Path(program_path)
+        
+        # 提示回调notify(级别, 标题, 消息)，级别为'info'、'warning'或'error'；
+        # 图形界面传入弹窗函数，命令行使用默认的输出
+        self.notify = notify or print_notification
         self.rule_path = self.program_path / "rule"
         self.logs_path = self.program_path / "logs"
-        self.security_manager = SecurityManager()
+        self.cache_path = self.program_path / "cache"
+        
+        # 规则内容存储：相同的rule.clean在存储中只保存一份，规则目录中的文件各自独立
+        self.blob_store = BlobStore(self.cache_path / "blobs")
+        self.security_manager = SecurityManager(self.blob_store)
+        
+        # 日志在后台线程中批量写入，按大小轮转压缩（rotate_logs_each_run为True时每次清理也轮转，
+        # 为None时使用config.json中的设置）；每次清理另有结构化运行记录
+        if rotate_logs_each_run is None:
+            rotate_logs_each_run = bool(self.get_setting('rotate_logs_each_run', False))
+        self.log_store = LogStore(self.logs_path, rotate_each_run=rotate_logs_each_run)
+        
+        # 编译规则缓存（执行、预览和显示共用）
+        self.rule_cache = RuleCache(self.cache_path / "compiled_rules.json")
+        
+        # 规则目录索引（只重新解析指纹变化的规则）
+        self.rule_catalog = RuleCatalog(self.rule_path, self.cache_path / "rule_catalog.jsonl",
+                                        self.read_rule_metadata)
+        
+        # 每个清理目标的目录日志（跳过mtime未变化的空目录）
+        self.target_journal = TargetJournal(self.cache_path / "journal")
+        
+        # 并行删除引擎（max_workers为并发数，默认按CPU核心数计算）
+        self.deletion_engine = DeletionEngine(max_workers)
+        
+        # 规则目标调度器（同一物理卷上同时清理的目标数）
+        self.volume_scheduler = VolumeScheduler(per_volume_workers)
+        
+        # 系统命令执行器（首次执行system行时创建，max_commands为同时运行的命令数上限）
+        self.max_commands = max_commands
+        self._command_runner = None
+        
+        # 规则目录监视器（由界面调用watch_rules启动）
+        self.rule_watcher = None
+        
+        # 加密规则完整性验证进程池（首次使用时创建）
+        self._verify_pool = None
+        self._verify_pool_lock = threading.Lock()
         
         # 确保必要目录存在
         self.ensure_directories()
     
+    def shutdown(self):
+        """程序退出前保存缓存并释放线程池"""
+        if self.rule_watcher is not None:
+            self.rule_watcher.stop()
+            self.rule_watcher = None
+        self.rule_cache.save()
+        self.rule_catalog.save()
+        self.target_journal.prune()
+        self.deletion_engine.shutdown()
+        if self._verify_pool is not None:
+            self._verify_pool.shutdown(wait=True, cancel_futures=True)
+        self.log_store.close()
+    
+    def get_setting(self, key, default=None):
+        """读取config.json中的设置"""
+        config_file = self.program_path / "config.json"
+        try:
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get(key, default)
+        except Exception as e:
+            print(f"读取设置失败: {e}")
+        return default
+    
+    def set_setting(self, key, value):
+        """写入config.json中的设置（保留其他设置）"""
+        config_file = self.program_path / "config.json"
+        try:
+            config = {}
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            config[key] = value
+            with open(config_file, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+            return True
+        except Exception as e:
+            print(f"保存设置失败: {e}")
+            return False
+    
+    def set_rotate_logs_each_run(self, enable):
+        """设置是否每次清理开始新的日志分段，并保存到config.json"""
+        self.log_store.rotate_each_run = bool(enable)
+        return self.set_setting('rotate_logs_each_run', bool(enable))
+    
     def ensure_directories(self):
         """确保必要的目录存在"""
         self.rule_path.mkdir(exist_ok=True)
@@ -35,6 +181,9 @@ class CleanToolsCore:
                 
             rule_dir = self.rule_path / rule_name
             rule_dir.mkdir(exist_ok=True)
+            # 不沿用旧内容的编译结果和验证结果（新内容的stat指纹可能与旧的相同）
+            self.rule_cache.invalidate(rule_dir / "rule.clean")
+            self.security_manager.clear_cache(rule_dir)
             
             # 检查是否需要加密
             if rule_data.get('encrypted', False):
@@ -55,13 +204,14 @@ class CleanToolsCore:
                     
                 # 保存rule.clean
                 rule_file = rule_dir / "rule.clean"
-                with open(rule_file, 'w', encoding='utf-8') as f:
-                    f.write(rule_data['rules'])
+                self.blob_store.write_text(rule_file, rule_data['rules'])
             
+            # 规则内容被替换后，旧内容可能已不再被任何规则使用
+            self.blob_store.prune()
             return str(rule_dir)
             
         except Exception as e:
-            messagebox.showerror("错误", f"保存规则失败: {str(e)}")
+            self.notify('error', "错误", f"保存规则失败: {str(e)}")
             return None
     
     def delete_rule(self, rule_name):
@@ -69,141 +219,317 @@ class CleanToolsCore:
         try:
             rule_dir = self.rule_path / rule_name.replace(' ', '_')
             if rule_dir.exists():
-                shutil.rmtree(rule_dir)
+                remove_tree(rule_dir)
+                self.unload_rule(rule_dir)
+                self.blob_store.prune()
                 return True
         except Exception as e:
-            messagebox.showerror("错误", f"删除规则失败: {str(e)}")
+            self.notify('error', "错误", f"删除规则失败: {str(e)}")
         return False
     
-    def import_rule(self, file_path):
-        """导入规则"""
+    def installed_rule_version(self, rule_dir):
+        """已安装规则的版本号（来自规则目录索引）"""
+        metadata = self.rule_catalog.lookup(rule_dir)
+        return metadata['info'].get('version') if metadata else None
+    
+    def import_rule(self, file_path, policy="skip"):
+        """导入规则或规则包
+        
+        内容哈希与已安装规则相同的规则直接跳过；其余冲突按policy处理：
+        'skip'跳过、'overwrite'覆盖、'keep-newer'只在包中版本更新时覆盖。
+        返回import_pack的结果字典，出错时返回None。
+        """
+        from rule_package import import_pack
+        
         try:
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    zip_ref.extractall(temp_dir)
-                    
-                    temp_path = Path(temp_dir)
-                    imported_count = 0
-                    
-                    for item in temp_path.iterdir():
-                        if item.is_dir():
-                            info_file = item / "info.cleantool"
-                            rule_file = item / "rule.clean"
-                            
-                            if info_file.exists() and rule_file.exists():
-                                target_dir = self.rule_path / item.name
-                                if target_dir.exists():
-                                    if not messagebox.askyesno("确认", f"规则 '{item.name}' 已存在，是否覆盖？"):
-                                        continue
-                                    shutil.rmtree(target_dir)
-                                
-                                shutil.copytree(item, target_dir)
-                                imported_count += 1
-                    
-                    if imported_count > 0:
-                        messagebox.showinfo("成功", f"成功导入 {imported_count} 个规则")
-                        return True
-                    else:
-                        messagebox.showwarning("警告", "未找到有效的规则文件")
-                        
+            result = import_pack(file_path, self.rule_path, policy, self.installed_rule_version)
         except Exception as e:
-            messagebox.showerror("错误", f"导入规则失败: {str(e)}")
-        return False
+            self.notify('error', "错误", f"导入规则失败: {str(e)}")
+            return None
+        
+        # 丢弃被覆盖规则的编译缓存和验证结果，并记录导入的规则内容（与已有规则相同的内容在存储中只保存一份）
+        for dir_name in result['imported']:
+            rule_file = self.rule_path / dir_name / "rule.clean"
+            self.rule_cache.invalidate(rule_file)
+            self.security_manager.clear_cache(rule_file.parent)
+            try:
+                self.blob_store.adopt(rule_file)
+            except OSError as e:
+                print(f"记录规则内容失败 {dir_name}: {e}")
+        if result['imported']:
+            self.blob_store.prune()
+        
+        if not any(result.values()):
+            self.notify('warning', "警告", "未找到有效的规则文件")
+            return result
+        
+        message = (f"导入 {len(result['imported'])} 个规则，"
+                   f"{len(result['unchanged'])} 个未变化，{len(result['skipped'])} 个已跳过")
+        if result['failed']:
+            details = "\n".join(f"{name}: {error}" for name, error in result['failed'])
+            self.notify('warning', "警告", f"{message}，{len(result['failed'])} 个失败:\n{details}")
+        else:
+            self.notify('info', "成功", message)
+        return result
+    
+    def export_rules(self, rule_infos, output_file):
+        """把选中的规则导出为带清单（名称、版本、内容哈希）的规则包，返回导出的规则数"""
+        from rule_package import export_pack
+        
+        try:
+            rules = [(info['rule_dir'], info['Name'], info.get('version', '')) for info in rule_infos]
+            entries = export_pack(rules, output_file)
+        except Exception as e:
+            self.notify('error', "错误", f"导出规则失败: {str(e)}")
+            return 0
+        return len(entries)
     
-    def load_rules(self):
-        """加载规则列表"""
+    def load_rules(self, defer_verification=False):
+        """加载规则列表
+        
+        规则元数据来自规则目录索引，只有指纹变化的目录才重新解析info.cleantool。
+        defer_verification=True时，需要验证的加密规则先标记为待验证
+        （integrity_status='pending'），由verify_rules_async在进程池中并行验证。
+        """
         rules_data = {}
         
         if not self.rule_path.exists():
             return rules_data
-            
-        for rule_dir in self.rule_path.iterdir():
-            if rule_dir.is_dir():
-                info_file = rule_dir / "info.cleantool"
-                rule_file = rule_dir / "rule.clean"
-                integrity_file = rule_dir / "rule.integrity"
+        
+        # 旧版本中规则文件是内容文件的只读硬链接，编辑一个规则会影响其他规则
+        self.blob_store.detach_links(self.rule_path.glob("*/rule.clean"))
+        
+        for rule_dir, metadata, error in self.rule_catalog.scan():
+            try:
+                if error is not None:
+                    raise error
+                rule_info = self.build_rule_info(rule_dir, metadata, defer_verification)
                 
-                if info_file.exists():
+                # 加载所有规则到列表中（包括无法验证的），但标记状态
+                rule_name = rule_info['Name']
+                rules_data[rule_name] = rule_info
+                    
+            except Exception as e:
+                log_message = f"加载规则失败 {rule_dir.name}: {str(e)}"
+                print(log_message)
+                self.write_log(f"[错误] {log_message}\n")
+        
+        self.rule_catalog.save()
+        return rules_data
+    
+    def load_rule(self, rule_dir, defer_verification=False):
+        """加载单个规则目录（规则目录变化时增量刷新用），不是有效规则时返回None"""
+        rule_dir = Path(rule_dir)
+        try:
+            metadata = self.rule_catalog.lookup(rule_dir)
+            if metadata is None:
+                return None
+            return self.build_rule_info(rule_dir, metadata, defer_verification)
+        except Exception as e:
+            log_message = f"加载规则失败 {rule_dir.name}: {str(e)}"
+            print(log_message)
+            self.write_log(f"[错误] {log_message}\n")
+            return None
+        finally:
+            self.rule_catalog.save()
+    
+    def unload_rule(self, rule_dir):
+        """规则目录被删除后移除它的索引条目、编译缓存和验证结果（规则目录变化时增量刷新用）"""
+        rule_dir = Path(rule_dir)
+        self.rule_cache.invalidate(rule_dir / "rule.clean")
+        self.security_manager.clear_cache(rule_dir)
+        self.rule_catalog.remove(rule_dir)
+        self.rule_catalog.save()
+    
+    def watch_rules(self, callback, interval=2.0):
+        """开始监视规则目录，规则目录增删改时回调callback(事件类型, 目录名)
+        
+        事件类型为'added'、'changed'或'removed'，回调在后台线程中执行。
+        """
+        if self.rule_watcher is None:
+            self.rule_watcher = RuleWatcher(self.rule_path, callback, interval)
+            self.rule_watcher.start()
+        return self.rule_watcher
+    
+    def read_rule_metadata(self, rule_dir):
+        """读取规则目录的元数据（只打开一次info.cleantool）"""
+        info_file = rule_dir / "info.cleantool"
+        integrity_file = rule_dir / "rule.integrity"
+        
+        try:
+            with open(info_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception as e:
+            print(f"解析info文件失败: {e}")
+            content = ''
+        
+        # 检测加密标识
+        is_encrypted = (integrity_file.exists() or 
+                        'random_key' in content or 
+                        '此文件为加密文件' in content)
+        
+        return {
+            'info': self.parse_info_text(content),
+            'is_encrypted': is_encrypted,
+            'has_integrity': integrity_file.exists()
+        }
+    
+    def build_rule_info(self, rule_dir, metadata, defer_verification=False):
+        """根据索引中的元数据构建规则信息，并处理加密规则的完整性验证"""
+        rule_info = dict(metadata['info'])
+        rule_info['rule_dir'] = rule_dir
+        rule_info['rule_file'] = rule_dir / "rule.clean"
+        
+        # 检查是否为加密文件
+        is_encrypted = metadata['is_encrypted']
+        rule_info['is_encrypted'] = is_encrypted
+        rule_info['is_tampered'] = False
+        rule_info['cannot_verify'] = False
+        
+        # 如果是加密文件，进行完整性验证
+        if is_encrypted and metadata['has_integrity']:
+            # 获取原始作者名（去除*号掩码）
+            original_author = rule_info.get('Auther', 'Unknown')
+            if '*' in original_author:
+                # 无法验证的情况
+                rule_info['cannot_verify'] = True
+                log_message = f"安全警告: 无法验证加密文件 {rule_dir.name} 的完整性 - 作者名已被掩码，禁止执行清理操作"
+                print(log_message)
+                self.write_log(f"[安全警告] {log_message}\n")
+                rule_info['integrity_status'] = 'cannot_verify'
+                rule_info['integrity_message'] = '无法验证 - 作者名已掩码，禁止执行'
+                log_message = f"规则 {rule_dir.name} 无法验证完整性，已加载但禁止执行"
+                print(log_message)
+                self.write_log(f"[安全提示] {log_message}\n")
+            else:
+                cached = self.security_manager.cached_result(rule_dir, original_author)
+                if cached is not None:
+                    self.apply_verification_result(rule_info, *cached)
+                elif defer_verification:
+                    rule_info['integrity_status'] = 'pending'
+                    rule_info['integrity_message'] = '正在验证完整性'
+                else:
+                    # 验证文件完整性
                     try:
-                        rule_info = self.parse_info_file(info_file)
-                        rule_info['rule_dir'] = rule_dir
-                        rule_info['rule_file'] = rule_file
-                        
-                        # 检查是否为加密文件
-                        is_encrypted = False
-                        tampered = False
-                        cannot_verify = False
-                        
-                        # 检测加密标识
-                        try:
-                            with open(info_file, 'r', encoding='utf-8') as f:
-                                content = f.read()
-                                if (integrity_file.exists() or 
-                                    'random_key' in content or 
-                                    '此文件为加密文件' in content):
-                                    is_encrypted = True
-                        except:
-                            pass
-                        
-                        # 如果是加密文件，进行完整性验证
-                        if is_encrypted and integrity_file.exists():
-                            try:
-                                # 获取原始作者名（去除*号掩码）
-                                original_author = rule_info.get('Auther', 'Unknown')
-                                if '*' in original_author:
-                                    # 无法验证的情况
-                                    cannot_verify = True
-                                    log_message = f"安全警告: 无法验证加密文件 {rule_dir.name} 的完整性 - 作者名已被掩码，禁止执行清理操作"
-                                    print(log_message)
-                                    self.write_log(f"[安全警告] {log_message}\n")
-                                    rule_info['integrity_status'] = 'cannot_verify'
-                                    rule_info['integrity_message'] = '无法验证 - 作者名已掩码，禁止执行'
-                                else:
-                                    # 验证文件完整性
-                                    is_valid, message = self.security_manager.verify_integrity(rule_dir, original_author)
-                                    rule_info['integrity_status'] = 'valid' if is_valid else 'tampered'
-                                    rule_info['integrity_message'] = message
-                                    
-                                    if not is_valid:
-                                        tampered = True
-                                        log_message = f"安全警告: 检测到文件篡改 {rule_dir.name} - {message}，禁止执行清理操作"
-                                        print(log_message)
-                                        self.write_log(f"[安全警告] {log_message}\n")
-                            except Exception as e:
-                                cannot_verify = True
-                                log_message = f"安全警告: 完整性验证出错 {rule_dir.name}: {str(e)}，禁止执行清理操作"
-                                print(log_message)
-                                self.write_log(f"[安全警告] {log_message}\n")
-                                rule_info['integrity_status'] = 'error'
-                                rule_info['integrity_message'] = f'验证出错: {str(e)}，禁止执行'
-                        
-                        rule_info['is_encrypted'] = is_encrypted
-                        rule_info['is_tampered'] = tampered
-                        rule_info['cannot_verify'] = cannot_verify
-                        
-                        # 加载所有规则到列表中（包括无法验证的），但标记状态
-                        rule_name = rule_info['Name']
-                        rules_data[rule_name] = rule_info
-                        
-                        # 记录跳过的规则
-                        if tampered:
-                            log_message = f"规则 {rule_dir.name} 已被篡改，已加载但禁止执行"
-                            print(log_message)
-                            self.write_log(f"[安全提示] {log_message}\n")
-                        elif cannot_verify:
-                            log_message = f"规则 {rule_dir.name} 无法验证完整性，已加载但禁止执行"
-                            print(log_message)
-                            self.write_log(f"[安全提示] {log_message}\n")
-                            
+                        is_valid, message = self.security_manager.verify_integrity(rule_dir, original_author)
+                        self.apply_verification_result(rule_info, is_valid, message)
                     except Exception as e:
-                        log_message = f"加载规则失败 {rule_dir.name}: {str(e)}"
-                        print(log_message)
-                        self.write_log(f"[错误] {log_message}\n")
+                        self.apply_verification_result(rule_info, False, None, error=e)
         
-        return rules_data
+        return rule_info
+    
+    def check_rule_security(self, rule_info):
+        """执行前的安全检查
+        
+        返回(阻止原因, 详细信息)，允许执行时阻止原因为None。阻止原因：
+        'tampered'、'cannot_verify'（包括验证出错）、'tampered_before_execution'、
+        'verification_exception'。
+        """
+        if not rule_info.get('is_encrypted', False):
+            return None, None
+        
+        integrity_message = rule_info.get('integrity_message', '')
+        if rule_info.get('is_tampered', False) or rule_info.get('cannot_verify', False):
+            integrity_status = rule_info.get('integrity_status', 'unknown')
+            if integrity_status == 'tampered':
+                return 'tampered', integrity_message
+            return 'cannot_verify', integrity_message
+        
+        # 执行前最后一次验证：只验证一个规则，直接读取文件计算哈希，不使用任何缓存
+        try:
+            is_valid, message = self.security_manager.verify_integrity(
+                rule_info.get('rule_dir'), rule_info.get('Auther', 'Unknown'), use_cache=False)
+        except Exception as e:
+            return 'verification_exception', str(e)
+        if not is_valid:
+            return 'tampered_before_execution', message
+        return None, None
+    
+    def apply_verification_result(self, rule_info, is_valid, message, error=None):
+        """把完整性验证结果写入规则信息，并记录安全日志"""
+        rule_dir = rule_info['rule_dir']
+        if error is not None:
+            log_message = f"安全警告: 完整性验证出错 {rule_dir.name}: {str(error)}，禁止执行清理操作"
+            print(log_message)
+            self.write_log(f"[安全警告] {log_message}\n")
+            rule_info['integrity_status'] = 'error'
+            rule_info['integrity_message'] = f'验证出错: {str(error)}，禁止执行'
+            rule_info['cannot_verify'] = True
+            log_message = f"规则 {rule_dir.name} 无法验证完整性，已加载但禁止执行"
+            print(log_message)
+            self.write_log(f"[安全提示] {log_message}\n")
+            return
+        
+        rule_info['integrity_status'] = 'valid' if is_valid else 'tampered'
+        rule_info['integrity_message'] = message
+        rule_info['is_tampered'] = not is_valid
+        
+        if not is_valid:
+            log_message = f"安全警告: 检测到文件篡改 {rule_dir.name} - {message}，禁止执行清理操作"
+            print(log_message)
+            self.write_log(f"[安全警告] {log_message}\n")
+            log_message = f"规则 {rule_dir.name} 已被篡改，已加载但禁止执行"
+            print(log_message)
+            self.write_log(f"[安全提示] {log_message}\n")
+    
+    def verify_rules_async(self, rules_data, callback=None):
+        """在进程池中并行验证待验证的加密规则
+        
+        每个规则验证完成后（在后台线程中）回调callback(rule_name, rule_info)。
+        """
+        futures = []
+        for rule_name, rule_info in rules_data.items():
+            if rule_info.get('integrity_status') != 'pending':
+                continue
+            author = rule_info.get('Auther', 'Unknown')
+            try:
+                future = self._get_verify_pool().submit(verify_rule_worker, str(rule_info['rule_dir']), author,
+                                                        str(self.blob_store.root))
+            except Exception:
+                # 进程池不可用时直接在当前线程中验证
+                future = Future()
+                try:
+                    future.set_result(verify_rule_worker(str(rule_info['rule_dir']), author,
+                                                         str(self.blob_store.root)))
+                except Exception as e:
+                    future.set_exception(e)
+            future.add_done_callback(
+                lambda f, name=rule_name, info=rule_info: self._on_rule_verified(f, name, info, callback))
+            futures.append(future)
+        return futures
+    
+    def _get_verify_pool(self):
+        """延迟创建验证用的进程池（PBKDF2为CPU密集型）"""
+        with self._verify_pool_lock:
+            if self._verify_pool is None:
+                # multiprocessing只在需要验证加密规则时才加载
+                from concurrent.futures import ProcessPoolExecutor
+                self._verify_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            return self._verify_pool
+    
+    def _on_rule_verified(self, future, rule_name, rule_info, callback):
+        """进程池验证完成"""
+        rule_dir = rule_info['rule_dir']
+        author = rule_info.get('Auther', 'Unknown')
+        try:
+            is_valid, message, cache_entry = future.result()
+            self.security_manager.import_cache_entry(rule_dir, author, cache_entry)
+        except Exception:
+            # 子进程异常退出等情况，在当前进程中重新验证
+            try:
+                is_valid, message = self.security_manager.verify_integrity(rule_dir, author)
+            except Exception as e:
+                self.apply_verification_result(rule_info, False, None, error=e)
+                if callback:
+                    callback(rule_name, rule_info)
+                return
+        
+        self.apply_verification_result(rule_info, is_valid, message)
+        if callback:
+            callback(rule_name, rule_info)
     
-    def parse_info_file(self, info_file):
-        """解析info.cleantool文件"""
+    def parse_info_text(self, content):
+        """解析info.cleantool文件内容"""
         rule_info = {
             'Name': 'Unknown',
             'version': '1.0',
@@ -211,29 +537,22 @@ class CleanToolsCore:
             'information': 'none'
         }
         
-        try:
-            with open(info_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            lines = content.split('\n')
-            current_key = None
-            current_value = []
-            
-            for line in lines:
-                line = line.strip()
-                if line in ['Name', 'version', 'Auther', 'information']:
-                    if current_key:
-                        rule_info[current_key] = '\n'.join(current_value).strip()
-                    current_key = line
-                    current_value = []
-                elif line and not line.startswith('{') and not line.startswith('}'):
-                    current_value.append(line)
-            
-            if current_key:
-                rule_info[current_key] = '\n'.join(current_value).strip()
-                
-        except Exception as e:
-            print(f"解析info文件失败: {e}")
+        lines = content.split('\n')
+        current_key = None
+        current_value = []
+        
+        for line in lines:
+            line = line.strip()
+            if line in ['Name', 'version', 'Auther', 'information']:
+                if current_key:
+                    rule_info[current_key] = '\n'.join(current_value).strip()
+                current_key = line
+                current_value = []
+            elif line and not line.startswith('{') and not line.startswith('}'):
+                current_value.append(line)
+        
+        if current_key:
+            rule_info[current_key] = '\n'.join(current_value).strip()
             
         return rule_info
     
@@ -248,16 +567,20 @@ class CleanToolsCore:
         rule_file = rule_info.get('rule_file')
         if rule_file and rule_file.exists():
             try:
-                with open(rule_file, 'r', encoding='utf-8') as f:
-                    rules_content = f.read()
+                rules_content = self.rule_cache.get(rule_file).text
                 info_text += "规则内容:\n" + rules_content
             except:
                 info_text += "无法读取规则内容"
         
         return info_text
     
-    def execute_clean_rule(self, rule_info, log_callback=None, progress_callback=None):
-        """执行清理规则"""
+    def execute_clean_rule(self, rule_info, log_callback=None, progress_callback=None, cancel_event=None,
+                           manifest=None, stats_callback=None):
+        """执行清理规则
+        
+        manifest为scan_rule返回的预览结果，规则未修改时直接按清单删除，不再遍历目录。
+        每个目标清理完成后回调stats_callback(目标, 统计信息)。
+        """
         try:
             rule_file = rule_info.get('rule_file')
             if not rule_file or not rule_file.exists():
@@ -268,92 +591,536 @@ class CleanToolsCore:
             if log_callback:
                 log_callback(f"开始执行清理规则: {rule_info['Name']}")
             
-            with open(rule_file, 'r', encoding='utf-8') as f:
-                rules = f.readlines()
+            # 先取得编译后的规则，再按阶段调度：连续的cl行并发执行，其他行作为顺序屏障
+            compiled = self.rule_cache.get(rule_file, verify=True)
+            operations = compiled.operations
             
-            total_rules = len([line for line in rules if line.strip() and not line.strip().startswith('#')])
-            current_rule = 0
+            if manifest is not None and manifest.get('digest') != compiled.digest:
+                if log_callback:
+                    log_callback("规则已修改，预览结果已失效，将重新遍历目录")
+                manifest = None
             
-            for line in rules:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                    
-                try:
-                    current_rule += 1
-                    progress = int((current_rule / total_rules) * 100) if total_rules > 0 else 0
-                    
-                    if progress_callback:
-                        progress_callback(progress, "🧹 清理中", f"处理规则 {current_rule}/{total_rules}")
-                    
-                    if line.startswith('cl '):
-                        # 清理路径
-                        path = line[3:].strip()
-                        self.clean_path(path, log_callback)
-                    elif line.startswith('system '):
-                        # 执行系统命令
-                        command = line[7:].strip()
-                        self.execute_system_command(command, log_callback)
-                    else:
-                        if log_callback:
-                            log_callback(f"未知规则格式: {line}")
-                        
-                except Exception as e:
-                    if log_callback:
-                        log_callback(f"执行规则失败 '{line}': {str(e)}")
+            # 结构化运行记录：每个目标一条，结束时再写一条汇总
+            rule_name = rule_info['Name']
+            run_id = self.log_store.begin_run()
+            run_started = time.monotonic()
             
-            return True
+            def record_target(target, stats, duration):
+                self.log_store.record('target', run_id, rule=rule_name, target=target,
+                                      files=stats['files'], deleted=stats['deleted'], failed=stats['failed'],
+                                      bytes_freed=stats['freed'], dirs_removed=stats.get('dirs_removed', 0),
+                                      dirs_skipped=stats.get('dirs_skipped', 0), filtered=stats.get('filtered', 0),
+                                      duration=round(duration, 3))
+                if stats_callback:
+                    stats_callback(target, stats)
+            
+            # 进度按文件数和字节数加权：有预览结果时使用其总量，否则边遍历边估算
+            def report(percent, done_files, total_files):
+                if progress_callback:
+                    progress_callback(percent, "🧹 清理中", f"已处理 {done_files}/{total_files} 个文件")
+            
+            progress = ProgressTracker(report, total_steps=len(operations))
+            if manifest is not None:
+                progress.set_expected(manifest['total_files'], manifest['total_bytes'])
+            
+            context = RunContext(cancel_event, manifest, record_target, progress)
+            try:
+                success = self.run_operations(operations, log_callback, context)
+            except Exception:
+                self.log_store.record('run', run_id, rule=rule_name, status='failed', targets=context.targets,
+                                      bytes_freed=context.bytes_freed,
+                                      duration=round(time.monotonic() - run_started, 3))
+                raise
+            self.log_store.record('run', run_id, rule=rule_name,
+                                  status='completed' if success else 'cancelled', targets=context.targets,
+                                  bytes_freed=context.bytes_freed,
+                                  duration=round(time.monotonic() - run_started, 3))
+            return success
             
         except Exception as e:
             if log_callback:
                 log_callback(f"执行规则时出错: {str(e)}")
             return False
     
-    def clean_path(self, path, log_callback):
-        """清理指定路径"""
+    def run_operations(self, operations, log_callback, context):
+        """按阶段执行编译后的规则操作，取消时返回False"""
+        def report_progress():
+            if context.progress is not None:
+                context.progress.step_done()
+        
+        batch = []
+        commands = []
+        for operation in operations:
+            if operation.kind == 'cl':
+                self.run_command_batch(commands, log_callback, report_progress, context)
+                commands = []
+                batch.append(operation)
+                continue
+            
+            # 其他行是顺序屏障：先完成之前累积的cl行
+            self.run_clean_batch(batch, log_callback, report_progress, context)
+            batch = []
+            
+            # 连续的system[parallel]行同时执行
+            if operation.kind == 'system' and operation.parallel:
+                commands.append(operation)
+                continue
+            self.run_command_batch(commands, log_callback, report_progress, context)
+            commands = []
+            
+            if context.cancelled():
+                break
+            
+            self.execute_operation(operation, log_callback, context)
+            report_progress()
+        
+        self.run_command_batch(commands, log_callback, report_progress, context)
+        self.run_clean_batch(batch, log_callback, report_progress, context)
+        if context.progress is not None:
+            context.progress.finish()
+        
+        if context.cancelled():
+            if log_callback:
+                log_callback("清理已取消")
+            return False
+        
+        return True
+    
+    def scan_rule(self, rule_info, log_callback=None, progress_callback=None, target_callback=None,
+                  cancel_event=None):
+        """预览扫描：遍历所有cl目标但不删除，统计每个目标的文件数和字节数
+        
+        每个目标扫描完成后按规则顺序回调target_callback(entry)；
+        返回的结果可作为删除清单传给execute_clean_rule。取消时返回None。
+        """
+        try:
+            rule_file = rule_info.get('rule_file')
+            if not rule_file or not rule_file.exists():
+                if log_callback:
+                    log_callback("规则文件不存在")
+                return None
+            
+            if log_callback:
+                log_callback(f"开始预览扫描: {rule_info['Name']}")
+            
+            compiled = self.rule_cache.get(rule_file, verify=True)
+            context = RunContext(cancel_event)
+            clean_operations = [op for op in compiled.operations if op.kind == 'cl']
+            result = {
+                'rule': rule_info['Name'],
+                'digest': compiled.digest,
+                'targets': {},
+                'total_files': 0,
+                'total_bytes': 0
+            }
+            
+            def make_job(index):
+                operation = clean_operations[index]
+                return lambda: self.scan_target(operation.path, context, operation.mode, operation.file_filter,
+                                                targets[index], covered[index])
+            
+            # 与执行时相同的去重：被其他行覆盖的目标不扫描；其余嵌套目标中的文件只计入按规则
+            # 顺序先执行的那一行，清单和总数中不会有重复的文件
+            targets, covered = [], []
+            for batch in self.clean_batches(compiled.operations):
+                _, batch_targets, batch_covered = self.plan_clean_batch(batch, context)
+                targets.extend(batch_targets)
+                covered.extend(batch_covered)
+            
+            jobs = []
+            for index, operation in enumerate(clean_operations):
+                first = targets[index][0] if targets[index] else operation.path
+                jobs.append((volume_key(first), make_job(index)))
+            
+            claimed = set()
+            
+            def on_result(index, entries):
+                result['targets'][clean_operations[index].line_no] = entries
+                for entry in entries:
+                    if entry['files']:
+                        self.unclaimed_files(entry, claimed)
+                    result['total_files'] += entry['count']
+                    result['total_bytes'] += entry['bytes']
+                    if target_callback:
+                        target_callback(entry)
+                if progress_callback:
+                    progress = int(((index + 1) / len(jobs)) * 100)
+                    progress_callback(progress, "🔍 扫描中", f"扫描目标 {index + 1}/{len(jobs)}")
+            
+            self.volume_scheduler.run(jobs, on_result, cancel_event)
+            
+            if context.cancelled():
+                if log_callback:
+                    log_callback("预览扫描已取消")
+                return None
+            
+            if log_callback:
+                log_callback(f"预览扫描完成: 共 {result['total_files']} 个文件, {format_size(result['total_bytes'])}")
+            return result
+            
+        except Exception as e:
+            if log_callback:
+                log_callback(f"预览扫描时出错: {str(e)}")
+            return None
+    
+    def clean_batches(self, operations):
+        """按run_operations的方式把连续的cl行分成可以一起调度的批"""
+        batches = []
+        batch = []
+        for operation in operations:
+            if operation.kind == 'cl':
+                batch.append(operation)
+            elif batch:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    @staticmethod
+    def unclaimed_files(entry, claimed):
+        """从预览条目中去掉已经计入其他条目的文件，并把剩下的文件加入claimed"""
+        files, sizes = [], []
+        for file_path, size in zip(entry['files'], entry['sizes']):
+            if file_path not in claimed:
+                claimed.add(file_path)
+                files.append(file_path)
+                sizes.append(size)
+        entry.update(files=files, sizes=sizes, count=len(files), bytes=sum(sizes))
+    
+    def scan_target(self, path, context, mode='files', file_filter=None, targets=None, covered=()):
+        """扫描单个cl目标，返回每个实际路径的统计条目
+        
+        mode为'prune'或'tree'时条目中还记录遍历到的目录，按清单删除文件后再删除这些目录。
+        file_filter为FileFilter时只列出符合条件的文件；不符合条件的单个文件条目kind为'filtered'。
+        targets和covered见plan_clean_batch，被其他行覆盖的目标条目kind为'covered'，不扫描。
+        """
+        if targets is None:
+            targets = context.expander.expand(path)
+        entries = [{'path': path, 'target': target, 'kind': 'covered', 'covered_by': line_no, 'mode': mode,
+                    'files': [], 'sizes': [], 'dirs': [], 'count': 0, 'bytes': 0} for target, line_no in covered]
+        if not targets and not covered:
+            return [{'path': path, 'target': path, 'kind': 'missing', 'mode': mode, 'files': [], 'sizes': [],
+                     'dirs': [], 'count': 0, 'bytes': 0}]
+        
+        for target in targets:
+            if context.cancelled():
+                break
+            entry = {'path': path, 'target': target, 'kind': 'missing', 'mode': mode, 'files': [], 'sizes': [],
+                     'dirs': [], 'count': 0, 'bytes': 0}
+            try:
+                if os.path.isfile(target):
+                    if not self.file_filter_accepts(file_filter, target):
+                        entry.update(kind='filtered')
+                    else:
+                        size = os.path.getsize(target)
+                        entry.update(kind='file', files=[target], sizes=[size], count=1, bytes=size)
+                elif os.path.isdir(target):
+                    journal = self.open_journal(target, mode)
+                    stats, files, sizes, dirs = self.deletion_engine.scan_directory(target, context.cancel_event,
+                                                                                    mode, journal, file_filter)
+                    if journal is not None:
+                        journal.save()
+                    if mode == 'files':
+                        dirs = []
+                    entry.update(kind='dir', files=files, sizes=sizes, dirs=dirs, count=stats['files'],
+                                 bytes=stats['bytes'])
+            except OSError:
+                pass
+            entries.append(entry)
+        return entries
+    
+    def execute_operation(self, operation, log_callback, context=None, targets=None, covered=()):
+        """执行单条规则（cl行的targets和covered见plan_clean_batch）"""
+        context = context or RunContext()
+        try:
+            if operation.kind == 'cl':
+                # 清理路径（有预览清单时按清单删除）
+                entries = context.manifest_entries(operation)
+                if entries is not None:
+                    self.clean_manifest_entries(entries, log_callback, context)
+                else:
+                    self.clean_target(operation.path, log_callback, context, operation.mode, operation.file_filter,
+                                      targets, covered)
+            elif operation.kind == 'system':
+                # 执行系统命令
+                self.execute_system_command(operation.command, log_callback, context.cancel_event, operation.timeout)
+            else:
+                if log_callback:
+                    log_callback(f"未知规则格式: {operation.line}")
+        except Exception as e:
+            if log_callback:
+                log_callback(f"执行规则失败 '{operation.line}': {str(e)}")
+    
+    @staticmethod
+    def covers(parent, child, same_path):
+        """parent行清理某个目录时是否已经完成child行对该目录（或其子路径）的清理"""
+        if parent.file_filter is not None:
+            return False
+        if parent.mode == 'tree' or child.mode == 'files':
+            return True
+        # prune保留目标目录本身，不能代替同一目录上的tree
+        return parent.mode == 'prune' and (child.mode == 'prune' or not same_path)
+    
+    def plan_clean_batch(self, batch, context):
+        """展开一组cl行的目标，处理相互嵌套的目标
+        
+        已被另一行完整清理的目标（例如cl X已经删除X\\sub中的所有文件）直接去掉；其余相互
+        嵌套的目标所在的行分到同一组，组内按规则顺序执行，只有完全不相交的组才同时执行。
+        返回(分组, 目标, 被覆盖的目标)：分组为batch下标的列表，组内按规则顺序排列；
+        目标[i]为第i行要清理的路径；被覆盖的目标[i]为[(路径, 覆盖它的行号)]。
+        """
+        expanded = [context.expander.expand(operation.path) for operation in batch]
+        items = sorted(((path_parts(target), index, target)
+                        for index, targets in enumerate(expanded) for target in targets),
+                       key=lambda item: (item[0], item[1]))
+        
+        groups = list(range(len(batch)))
+        
+        def find(index):
+            while groups[index] != index:
+                groups[index] = groups[groups[index]]
+                index = groups[index]
+            return index
+        
+        covered = [[] for _ in batch]
+        dropped = set()
+        # 按路径各级名称排序后，每个路径的祖先都在它之前，栈中保留当前路径的所有祖先
+        ancestors = []
+        for parts, index, target in items:
+            while ancestors and parts[:len(ancestors[-1][0])] != ancestors[-1][0]:
+                ancestors.pop()
+            covering = next((other for other_parts, other in ancestors
+                             if self.covers(batch[other], batch[index], other_parts == parts)), None)
+            if covering is not None:
+                covered[index].append((target, batch[covering].line_no))
+                dropped.add((index, target))
+                continue
+            if ancestors:
+                groups[find(index)] = find(ancestors[-1][1])
+            ancestors.append((parts, index))
+        
+        targets = [[target for target in op_targets if (index, target) not in dropped]
+                   for index, op_targets in enumerate(expanded)]
+        members = {}
+        for index in range(len(batch)):
+            members.setdefault(find(index), []).append(index)
+        return sorted(members.values()), targets, covered
+    
+    def run_clean_batch(self, batch, log_callback, report_progress, context):
+        """并发执行一组cl规则
+        
+        相互嵌套的目标按plan_clean_batch去重或分组，不同组中不同物理卷上的目标同时清理，
+        同一卷上的并发数受per_volume_workers限制；每行的日志先缓存，再按规则顺序输出。
+        """
+        if not batch:
+            return
+        groups, targets, covered = self.plan_clean_batch(batch, context)
+        
+        def make_job(group):
+            def job():
+                results = []
+                for index in group:
+                    messages = []
+                    self.execute_operation(batch[index], messages.append, context, targets[index], covered[index])
+                    results.append((index, messages))
+                return results
+            return job
+        
+        # 按组中第一个实际目标所在的卷分组
+        jobs = []
+        for group in groups:
+            first = next((targets[index][0] for index in group if targets[index]), batch[group[0]].path)
+            jobs.append((volume_key(first), make_job(group)))
+        
+        finished = {}
+        next_index = 0
+        
+        def on_result(_, results):
+            nonlocal next_index
+            finished.update(results)
+            while next_index in finished:
+                if log_callback:
+                    for message in finished.pop(next_index):
+                        log_callback(message)
+                else:
+                    finished.pop(next_index)
+                report_progress()
+                next_index += 1
+        
+        self.volume_scheduler.run(jobs, on_result, context.cancel_event)
+        # 取消时未执行的组不会回调，已完成的行的日志照常输出
+        for index in sorted(finished):
+            if log_callback:
+                for message in finished[index]:
+                    log_callback(message)
+            report_progress()
+    
+    def clean_target(self, path, log_callback, context=None, mode='files', file_filter=None, targets=None,
+                     covered=()):
+        """展开规则中的环境变量和通配符，逐个清理匹配到的路径
+        
+        targets为已经展开的路径，covered为已由其他行清理的[(路径, 行号)]（见plan_clean_batch）。
+        """
+        context = context or RunContext()
+        if targets is None:
+            targets = context.expander.expand(path)
+        for target, line_no in covered:
+            if log_callback:
+                log_callback(TargetLog(f"已包含在第{line_no}行的清理目标中: {target}"))
+        if not targets:
+            if log_callback and not covered:
+                log_callback(f"路径不存在: {path}")
+            return
+        
+        for target in targets:
+            if context.cancelled():
+                break
+            started = time.monotonic()
+            stats = self.clean_path(target, log_callback, context.cancel_event, context.progress, mode,
+                                    file_filter)
+            if stats is not None:
+                context.record_target(target, stats, time.monotonic() - started)
+    
+    def clean_manifest_entries(self, entries, log_callback, context=None):
+        """按预览扫描的清单删除文件"""
+        context = context or RunContext()
+        for entry in entries:
+            if context.cancelled():
+                break
+            target = entry['target']
+            started = time.monotonic()
+            try:
+                if entry['kind'] == 'file':
+                    size = entry['bytes']
+                    os.unlink(target)
+                    if context.progress is not None:
+                        context.progress.advance(1, size)
+                    context.record_target(target, self.single_file_stats(size), time.monotonic() - started)
+                    if log_callback:
+                        log_callback(TargetLog(f"已删除文件: {target}"))
+                elif entry['kind'] == 'dir':
+                    stats = self.deletion_engine.delete_files(entry['files'], context.cancel_event,
+                                                              entry.get('sizes'), context.progress)
+                    mode = entry.get('mode', 'files')
+                    if entry.get('dirs') and not context.cancelled():
+                        stats['dirs_removed'] = self.deletion_engine.remove_empty_dirs(
+                            entry['dirs'], keep=target if mode == 'prune' else None)
+                    context.record_target(target, stats, time.monotonic() - started)
+                    if log_callback:
+                        log_callback(self.directory_cleaned_message(target, mode, stats))
+                elif entry['kind'] == 'filtered':
+                    if log_callback:
+                        log_callback(TargetLog(f"文件不符合过滤条件，已保留: {target}"))
+                elif entry['kind'] == 'covered':
+                    if log_callback:
+                        log_callback(TargetLog(f"已包含在第{entry['covered_by']}行的清理目标中: {target}"))
+                else:
+                    if log_callback:
+                        log_callback(f"路径不存在: {entry['path']}")
+            except Exception as e:
+                if log_callback:
+                    log_callback(f"清理路径失败 {target}: {str(e)}")
+    
+    @staticmethod
+    def single_file_stats(size):
+        """删除单个文件的统计信息（与删除引擎的统计格式相同）"""
+        return {'files': 1, 'deleted': 1, 'failed': 0, 'dirs': 0, 'bytes': size, 'freed': size,
+                'dirs_removed': 0, 'dirs_skipped': 0, 'filtered': 0}
+    
+    @staticmethod
+    def directory_cleaned_message(target, mode, stats):
+        """目录清理完成的日志（TargetLog）"""
+        if mode == 'tree':
+            if not os.path.lexists(target):
+                return TargetLog(f"已删除目录: {target}")
+            return TargetLog(f"已清理目录（部分文件或目录无法删除）: {target}")
+        kept = f"（{stats['filtered']} 个文件不符合过滤条件，已保留）" if stats.get('filtered') else ""
+        if mode == 'prune':
+            return TargetLog(f"已清理目录并删除 {stats['dirs_removed']} 个空目录{kept}: {target}")
+        return TargetLog(f"已清理目录{kept}: {target}")
+    
+    @staticmethod
+    def file_filter_accepts(file_filter, path):
+        """单个文件是否符合cl行的过滤条件（没有过滤条件时总是符合）"""
+        if file_filter is None:
+            return True
+        return file_filter.matcher(os.path.dirname(path))(path, os.stat(path))
+    
+    def open_journal(self, target, mode):
+        """清理目标的目录日志；删除整个目录时不需要"""
+        if mode == 'tree':
+            return None
+        return self.target_journal.open(os.fspath(target))
+    
+    def clean_path(self, path, log_callback, cancel_event=None, progress=None, mode='files', file_filter=None):
+        """清理指定路径，返回删除统计信息（路径不存在或失败时返回None）
+        
+        目录按mode处理：'files'只删除文件并保留目录结构，'prune'同时删除变空的子目录，
+        'tree'删除整个目录。file_filter为FileFilter时只删除符合条件的文件。
+        """
         try:
             path_obj = Path(path)
             if path_obj.exists():
                 if path_obj.is_file():
+                    if not self.file_filter_accepts(file_filter, path):
+                        if log_callback:
+                            log_callback(TargetLog(f"文件不符合过滤条件，已保留: {path}"))
+                        return None
+                    size = path_obj.stat().st_size
                     path_obj.unlink()
+                    if progress is not None:
+                        progress.discover(1, size)
+                        progress.advance(1, size)
                     if log_callback:
-                        log_callback(f"已删除文件: {path}")
+                        log_callback(TargetLog(f"已删除文件: {path}"))
+                    return self.single_file_stats(size)
                 elif path_obj.is_dir():
-                    # 删除目录中的所有文件，但保留目录结构
-                    for item in path_obj.rglob('*'):
-                        if item.is_file():
-                            try:
-                                item.unlink()
-                            except:
-                                pass
+                    journal = self.open_journal(path_obj, mode)
+                    stats = self.deletion_engine.clean_directory(path_obj, cancel_event, progress, mode, journal,
+                                                                 file_filter)
+                    if journal is not None:
+                        journal.save()
                     if log_callback:
-                        log_callback(f"已清理目录: {path}")
+                        log_callback(self.directory_cleaned_message(path, mode, stats))
+                    return stats
             else:
                 if log_callback:
                     log_callback(f"路径不存在: {path}")
         except Exception as e:
             if log_callback:
                 log_callback(f"清理路径失败 {path}: {str(e)}")
+        return None
     
-    def execute_system_command(self, command, log_callback):
-        """执行系统命令"""
-        try:
-            if log_callback:
-                log_callback(f"执行命令: {command}")
-            result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=30)
-            if result.returncode == 0:
-                if log_callback:
-                    log_callback(f"命令执行成功")
-                    if result.stdout:
-                        log_callback(f"输出: {result.stdout.strip()}")
-            else:
+    @property
+    def command_runner(self):
+        """系统命令执行器（导入asyncio会加载subprocess，首次使用时才创建）"""
+        if self._command_runner is None:
+            from command_runner import CommandRunner
+            self._command_runner = CommandRunner(self.max_commands)
+        return self._command_runner
+    
+    def run_command_batch(self, batch, log_callback, report_progress, context):
+        """同时执行一组system[parallel]行，输出按行写入日志，每行日志前标明规则行号"""
+        if not batch:
+            return
+        
+        if not context.cancelled():
+            labelled = len(batch) > 1
+            commands = [(f"[第{operation.line_no}行] " if labelled else "", operation.command, operation.timeout)
+                        for operation in batch]
+            try:
+                self.command_runner.run(commands, log_callback, context.cancel_event)
+            except Exception as e:
                 if log_callback:
-                    log_callback(f"命令执行失败，返回码: {result.returncode}")
-                    if result.stderr:
-                        log_callback(f"错误: {result.stderr.strip()}")
-        except subprocess.TimeoutExpired:
-            if log_callback:
-                log_callback(f"命令执行超时: {command}")
+                    log_callback(f"执行命令失败: {str(e)}")
+        for _ in batch:
+            report_progress()
+    
+    def execute_system_command(self, command, log_callback, cancel_event=None, timeout=DEFAULT_COMMAND_TIMEOUT):
+        """执行系统命令，输出边运行边写入日志；timeout为None时不限时间"""
+        try:
+            self.command_runner.run([("", command, timeout)], log_callback, cancel_event)
         except Exception as e:
             if log_callback:
                 log_callback(f"执行命令失败 {command}: {str(e)}")
@@ -361,25 +1128,24 @@ class CleanToolsCore:
     def clear_logs(self):
         """清理日志"""
         try:
+            # 先关闭日志文件，否则Windows上无法删除
+            self.log_store.close()
             if self.logs_path.exists():
                 shutil.rmtree(self.logs_path)
             self.logs_path.mkdir(exist_ok=True)
             return True
         except Exception as e:
-            messagebox.showerror("错误", f"清理日志失败: {str(e)}")
+            self.notify('error', "错误", f"清理日志失败: {str(e)}")
             return False
     
     def write_log(self, message):
-        """写入日志文件"""
-        try:
-            log_file = self.logs_path / "clean.log"
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(message)
-        except:
-            pass
+        """写入日志文件（异步批量写入）"""
+        self.log_store.write(message)
     
     def get_pagefile_info(self):
         """获取页面文件信息"""
+        import subprocess
+        
         try:
             result = subprocess.run(
                 'wmic pagefile list /format:list',
@@ -393,6 +1159,8 @@ class CleanToolsCore:
     
     def set_pagefile(self, drive, initial_size, max_size, system_managed=False):
         """设置页面文件"""
+        import subprocess
+        
         try:
             if system_managed:
                 # 启用系统管理的页面文件
@@ -408,6 +1176,8 @@ class CleanToolsCore:
     
     def disable_pagefile(self, drive):
         """禁用页面文件"""
+        import subprocess
+        
         try:
             command = f'wmic pagefileset where name="{drive}:\\pagefile.sys" delete'
             result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
@@ -417,6 +1187,8 @@ class CleanToolsCore:
     
     def get_hibernate_status(self):
         """获取休眠状态"""
+        import subprocess
+        
         try:
             result = subprocess.run(
                 'powercfg /query SCHEME_CURRENT SUB_SLEEP HIBERNATEIDLE',
@@ -430,9 +1202,91 @@ class CleanToolsCore:
     
     def set_hibernate(self, enable=True):
         """启用或禁用休眠"""
+        import subprocess
+        
         try:
             command = 'powercfg /hibernate on' if enable else 'powercfg /hibernate off'
             result = subprocess.run(command, shell=True, capture_output=True, text=True, timeout=10)
             return result.returncode == 0, result.stderr if result.returncode != 0 else ("休眠已启用" if enable else "休眠已禁用")
         except Exception as e:
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
+
+class CleanTask:
+    """后台清理任务 - 在工作线程中执行规则（或预览扫描），通过线程安全队列发送进度和日志事件
+    
+    事件格式:
+        ('log', message)
+        ('progress', value, status, detail)
+        ('scan_target', entry)          仅预览扫描
+        ('target_done', target, stats)  仅执行清理，每个目标完成后
+        ('done', result, cancelled)     执行时result为是否成功，预览扫描时为扫描结果
+    """
+    
+    def __init__(self, core, rule_info, scan=False, manifest=None):
+        self.core = core
+        self.rule_info = rule_info
+        self.scan = scan
+        self.manifest = manifest
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        """启动后台线程"""
+        self.thread = threading.Thread(target=self._run, name="clean-task", daemon=True)
+        self.thread.start()
+    
+    def cancel(self):
+        """请求取消，引擎会在文件之间停止"""
+        self.cancel_event.set()
+    
+    def is_running(self):
+        """是否仍在运行"""
+        return self.thread is not None and self.thread.is_alive()
+    
+    def _log(self, message):
+        self.events.put(('log', message))
+    
+    def _progress(self, value=0, status=None, detail=""):
+        self.events.put(('progress', value, status, detail))
+    
+    def _scan_target(self, entry):
+        self.events.put(('scan_target', entry))
+    
+    def _target_done(self, target, stats):
+        self.events.put(('target_done', target, stats))
+    
+    def _run(self):
+        result = None if self.scan else False
+        try:
+            if self.scan:
+                result = self.core.scan_rule(
+                    self.rule_info,
+                    self._log,
+                    self._progress,
+                    self._scan_target,
+                    self.cancel_event
+                )
+            else:
+                result = self.core.execute_clean_rule(
+                    self.rule_info,
+                    self._log,
+                    self._progress,
+                    self.cancel_event,
+                    self.manifest,
+                    self._target_done
+                )
+        except Exception as e:
+            self._log(f"执行规则时出错: {str(e)}")
+        finally:
+            self.events.put(('done', result, self.cancel_event.is_set()))
+    
+    def drain(self, max_events=500):
+        """取出一批事件（非阻塞）"""
+        events = []
+        try:
+            while len(events) < max_events:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import gzip
+import time
+import uuid
+import queue
+import shutil
+import datetime
+import threading
+from pathlib import Path
+
+_STOP = object()
+_ROTATE = object()
+
+# 分段文件名中的轮转时间，按文件名排序即按时间排序
+SEGMENT_STAMP = "%Y%m%d-%H%M%S-%f"
+
+
+def read_lines_reversed(path, block_size=64 * 1024):
+    """从文件末尾开始逐行向前读取（不把整个文件读入内存）"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        at_end = True
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b'\n')
+            remainder = lines.pop(0)
+            if at_end and lines and lines[-1] == b'':
+                lines.pop()
+            at_end = False
+            for line in reversed(lines):
+                yield line.decode('utf-8', 'replace') + '\n'
+        if remainder:
+            yield remainder.decode('utf-8', 'replace') + '\n'
+
+
+class LogWriter:
+    """异步日志写入器 - 后台线程批量写入日志文件，write()不会阻塞调用方
+
+    日志先缓存在内存中，累计达到flush_bytes或距第一条未写入的日志超过
+    flush_interval秒时写入一次；日志文件在两次写入之间保持打开。
+    文件超过max_bytes时轮转为gzip压缩的分段（clean-20240101-120000-000000.log.gz），
+    最多保留backup_count个分段，超过max_age_days天的分段也会被删除。
+    """
+
+    def __init__(self, log_file, flush_bytes=64 * 1024, flush_interval=0.5,
+                 max_bytes=4 * 1024 * 1024, backup_count=10, max_age_days=None):
+        self.log_file = Path(log_file)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_age_days = max_age_days
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """首次写入时启动后台线程"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, message):
+        """写入一条日志（只放入队列）"""
+        self._ensure_started()
+        self._queue.put(message)
+
+    def flush(self, timeout=5):
+        """等待已提交的日志全部写入文件"""
+        with self._lock:
+            if self._thread is None:
+                return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def rotate(self):
+        """写入剩余日志后立即轮转当前文件（例如每次运行单独一个分段）"""
+        self._ensure_started()
+        self._queue.put(_ROTATE)
+
+    def segments(self):
+        """已轮转的压缩分段，按时间从旧到新排列"""
+        pattern = f"{self.log_file.stem}-*{self.log_file.suffix}.gz"
+        return sorted(self.log_file.parent.glob(pattern))
+
+    def _rotate_file(self):
+        """把当前日志文件压缩为分段并按保留策略删除旧分段"""
+        if not self.log_file.exists() or self.log_file.stat().st_size == 0:
+            return
+        stamp = datetime.datetime.now().strftime(SEGMENT_STAMP)
+        segment = self.log_file.with_name(f"{self.log_file.stem}-{stamp}{self.log_file.suffix}.gz")
+        # 先改名再压缩，压缩期间的新日志写入新文件
+        pending = self.log_file.with_name(self.log_file.name + ".rotating")
+        os.replace(self.log_file, pending)
+        with open(pending, 'rb') as source, gzip.open(segment, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.unlink(pending)
+        self._prune()
+
+    def segment_time(self, segment):
+        """分段的轮转时间（分段内所有记录都早于这个时间）"""
+        stamp = segment.name[len(self.log_file.stem) + 1:].split('.', 1)[0]
+        try:
+            return datetime.datetime.strptime(stamp, SEGMENT_STAMP)
+        except ValueError:
+            return None
+
+    def _prune(self):
+        """按数量和时间删除旧分段"""
+        segments = self.segments()
+        expired = []
+        if self.backup_count is not None and len(segments) > self.backup_count:
+            expired = segments[:len(segments) - self.backup_count]
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            expired.extend(s for s in segments if s not in expired and s.stat().st_mtime < cutoff)
+        for segment in expired:
+            try:
+                segment.unlink()
+            except OSError:
+                pass
+
+    def close(self, timeout=5):
+        """写入剩余日志并关闭文件（之后再写入会重新打开）"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        handle = None
+        buffer = []
+        size = 0
+        deadline = None
+
+        def close_handle():
+            nonlocal handle
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+                handle = None
+
+        def rotate():
+            close_handle()
+            try:
+                self._rotate_file()
+            except Exception as e:
+                print(f"日志轮转失败: {e}")
+
+        def write_buffer():
+            nonlocal handle, buffer, size, deadline
+            if buffer:
+                try:
+                    if handle is None:
+                        self.log_file.parent.mkdir(exist_ok=True)
+                        handle = open(self.log_file, 'a', encoding='utf-8')
+                    if self.max_bytes and handle.tell() > 0 and handle.tell() + size > self.max_bytes:
+                        rotate()
+                        handle = open(self.log_file, 'a', encoding='utf-8')
+                    handle.write(''.join(buffer))
+                    handle.flush()
+                except Exception:
+                    # 写入失败时丢弃这批日志，下次重新打开文件
+                    close_handle()
+            buffer = []
+            size = 0
+            deadline = None
+
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                write_buffer()
+                continue
+
+            if item is _STOP:
+                write_buffer()
+                close_handle()
+                return
+            if item is _ROTATE:
+                write_buffer()
+                rotate()
+                continue
+            if isinstance(item, threading.Event):
+                write_buffer()
+                item.set()
+                continue
+
+            buffer.append(item)
+            size += len(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if size >= self.flush_bytes:
+                write_buffer()
+
+
+class LogStore:
+    """日志存储 - 文本日志clean.log和结构化运行记录runs.jsonl
+
+    runs.jsonl每行一条JSON记录：
+        {"type": "target", "run_id", "time", "rule", "target", "files", "deleted",
+         "failed", "bytes_freed", "dirs_removed", "dirs_skipped", "filtered", "duration"}
+        {"type": "run", "run_id", "time", "rule", "status", "targets", "bytes_freed", "duration"}
+    两个文件都按大小轮转、压缩并按保留策略清理。
+    """
+
+    def __init__(self, logs_path, max_bytes=4 * 1024 * 1024, backup_count=10, max_age_days=90,
+                 rotate_each_run=False):
+        self.logs_path = Path(logs_path)
+        self.rotate_each_run = rotate_each_run
+        self.text_log = LogWriter(self.logs_path / "clean.log", max_bytes=max_bytes,
+                                  backup_count=backup_count, max_age_days=max_age_days)
+        self.run_log = LogWriter(self.logs_path / "runs.jsonl", max_bytes=max_bytes,
+                                 backup_count=backup_count, max_age_days=max_age_days)
+
+    def write(self, message):
+        """写入文本日志"""
+        self.text_log.write(message)
+
+    def begin_run(self):
+        """开始一次清理，返回运行ID"""
+        if self.rotate_each_run:
+            self.text_log.rotate()
+            self.run_log.rotate()
+        return uuid.uuid4().hex[:12]
+
+    def record(self, record_type, run_id, **fields):
+        """写入一条结构化记录"""
+        record = {
+            'type': record_type,
+            'run_id': run_id,
+            'time': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        record.update(fields)
+        self.run_log.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def iter_history(self):
+        """从新到旧逐行读取文本日志（包括已轮转的分段）"""
+        self.text_log.flush()
+        if self.text_log.log_file.exists():
+            yield from read_lines_reversed(self.text_log.log_file)
+        for segment in reversed(self.text_log.segments()):
+            with gzip.open(segment, 'rt', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+            yield from reversed(lines)
+    
+    def search_runs(self, rule=None, run_id=None, record_type=None, since=None):
+        """按规则名、运行ID、记录类型或起始时间（ISO格式字符串）查找运行记录，从旧到新返回"""
+        self.run_log.flush()
+        files = self.run_log.segments()
+        if self.run_log.log_file.exists():
+            files.append(self.run_log.log_file)
+        for path in files:
+            # 分段文件名中带有轮转时间，早于since的整段跳过
+            if since is not None and path.suffix == '.gz':
+                rotated = self.run_log.segment_time(path)
+                if rotated is not None and rotated.isoformat(timespec='seconds') < since:
+                    continue
+            try:
+                opener = gzip.open if path.suffix == '.gz' else open
+                with opener(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if rule is not None and record.get('rule') != rule:
+                            continue
+                        if run_id is not None and record.get('run_id') != run_id:
+                            continue
+                        if record_type is not None and record.get('type') != record_type:
+                            continue
+                        if since is not None and record.get('time', '') < since:
+                            continue
+                        yield record
+            except OSError as e:
+                print(f"读取运行记录失败 {path.name}: {e}")
+
+    def flush(self):
+        """等待日志全部写入"""
+        self.text_log.flush()
+        self.run_log.flush()
+
+    def close(self):
+        """关闭日志文件"""
+        self.text_log.close()
+        self.run_log.close()
@@ -4,17 +4,17 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import os
 import sys
-import subprocess
-import winreg
-import ctypes
+import time
+import queue
 from pathlib import Path
+from collections import deque
 import datetime
-from Crypto.Cipher import AES
-from lib import CleanToolsCore
+from lib import CleanToolsCore, CleanTask, TargetLog, format_size
 from i18n import init_i18n, get_translator, t
 
 def is_admin():
     """检查是否具有管理员权限"""
+    import ctypes
     try:
         return ctypes.windll.shell32.IsUserAnAdmin() != 0
     except Exception:
@@ -22,6 +22,7 @@ def is_admin():
 
 def run_as_admin():
     """以管理员权限重新运行程序"""
+    import ctypes
     if is_admin():
         return True
     else:
@@ -77,6 +78,50 @@ def main():
     # 启动主循环
     root.mainloop()
 
+
+class LogView:
+    """日志显示 - 合并消息后定时批量插入，文本框中只保留最近max_lines行"""
+    
+    def __init__(self, root, max_lines=2000, flush_interval=100):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.lines = deque(maxlen=max_lines)
+        self.pending = []
+        self.flush_scheduled = False
+        self.widget = None
+    
+    def attach(self, widget):
+        """绑定文本框（界面重建后重新显示缓冲的日志）"""
+        self.widget = widget
+        self.pending = []
+        if self.lines:
+            widget.insert(tk.END, ''.join(self.lines))
+            widget.see(tk.END)
+    
+    def append(self, line):
+        """添加一行日志，稍后统一刷新到文本框"""
+        self.lines.append(line)
+        self.pending.append(line)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.root.after(self.flush_interval, self.flush)
+    
+    def flush(self):
+        """把缓存的日志一次性插入文本框，并删除超出上限的旧行"""
+        self.flush_scheduled = False
+        pending = self.pending[-self.lines.maxlen:]
+        self.pending = []
+        if not pending or self.widget is None:
+            return
+        
+        self.widget.insert(tk.END, ''.join(pending))
+        line_count = int(self.widget.index('end-1c').split('.')[0]) - 1
+        excess = line_count - self.lines.maxlen
+        if excess > 0:
+            self.widget.delete('1.0', f'{excess + 1}.0')
+        self.widget.see(tk.END)
+
+
 class CleanToolsGUI:
     def __init__(self, root):
         self.root = root
@@ -87,7 +132,7 @@ class CleanToolsGUI:
         
         # 初始化核心组件
         program_path = Path(__file__).parent
-        self.core = CleanToolsCore(program_path)
+        self.core = CleanToolsCore(program_path, notify=self.notify)
         
         # 获取翻译器实例
         self.translator = get_translator()
@@ -95,10 +140,19 @@ class CleanToolsGUI:
         # 初始化变量
         self.current_rule = None
         self.rules_data = {}
-        
-        # 创建界面
+        self.clean_task = None
+        self.clean_task_rule = None
+        self.last_scan = None
+        self.verify_events = queue.Queue()
+        self.verify_polling = False
+        self.watch_events = queue.Queue()
+        self.log_view = LogView(self.root)
+        self.summary_mode = tk.BooleanVar(value=False)
+        self.run_stats = None
+        
+        # 创建界面；规则列表在主窗口显示后再加载
         self.create_widgets()
-        self.load_rules()
+        self.root.after_idle(self.start_loading_rules)
         
         # 设置图标（如果存在）
         icon_path = program_path / "icon.ico"
@@ -107,6 +161,9 @@ class CleanToolsGUI:
                 self.root.iconbitmap(str(icon_path))
             except:
                 pass
+        
+        # 关闭窗口时先停止后台清理
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def create_widgets(self):
         """创建界面组件"""
@@ -140,7 +197,7 @@ class CleanToolsGUI:
         left_frame.pack(side="left", fill="both", expand=True, padx=(0, 5))
         
         # 规则列表
-        self.rule_listbox = tk.Listbox(left_frame)
+        self.rule_listbox = tk.Listbox(left_frame, selectmode=tk.EXTENDED)
         self.rule_listbox.pack(fill="both", expand=True, padx=5, pady=5)
         self.rule_listbox.bind("<<ListboxSelect>>", self.on_rule_select)
         
@@ -152,6 +209,7 @@ class CleanToolsGUI:
         ttk.Button(rule_btn_frame, text=t('edit_rule'), command=self.edit_rule).pack(side="left", padx=2)
         ttk.Button(rule_btn_frame, text=t('delete_rule'), command=self.delete_rule).pack(side="left", padx=2)
         ttk.Button(rule_btn_frame, text=t('import_rule'), command=self.import_rule).pack(side="left", padx=2)
+        ttk.Button(rule_btn_frame, text=t('export_rule'), command=self.export_rules).pack(side="left", padx=2)
         
         # 右侧：规则信息显示
         right_frame = ttk.LabelFrame(main_frame, text=t('rule_info'))
@@ -164,9 +222,24 @@ class CleanToolsGUI:
         clean_frame = ttk.LabelFrame(self.root, text=t('clean_operation'))
         clean_frame.pack(fill="x", padx=10, pady=5)
         
+        clean_btn_frame = ttk.Frame(clean_frame)
+        clean_btn_frame.pack(pady=10)
+        
         # 开始清理按钮
-        self.clean_btn = ttk.Button(clean_frame, text=t('start_clean'), command=self.start_clean)
-        self.clean_btn.pack(pady=10)
+        self.clean_btn = ttk.Button(clean_btn_frame, text=t('start_clean'), command=self.start_clean)
+        self.clean_btn.pack(side="left", padx=5)
+        
+        # 预览扫描按钮
+        self.scan_btn = ttk.Button(clean_btn_frame, text=t('scan_preview'), command=self.start_scan)
+        self.scan_btn.pack(side="left", padx=5)
+        
+        # 取消清理按钮
+        self.cancel_btn = ttk.Button(clean_btn_frame, text=t('cancel_clean'), command=self.cancel_clean, state="disabled")
+        self.cancel_btn.pack(side="left", padx=5)
+        
+        # 后台任务运行中重建界面时保持按钮状态
+        if self.clean_task and self.clean_task.is_running():
+            self.set_task_buttons(True)
         
         # 创建进度条区域
         self.create_progress_area()
@@ -175,8 +248,18 @@ class CleanToolsGUI:
         log_frame = ttk.LabelFrame(self.root, text=t('operation_log'))
         log_frame.pack(fill="both", expand=True, padx=10, pady=5)
         
+        log_toolbar = ttk.Frame(log_frame)
+        log_toolbar.pack(fill="x", padx=5, pady=(5, 0))
+        
+        ttk.Checkbutton(log_toolbar, text=t('log_summary_mode'), variable=self.summary_mode).pack(side="left")
+        self.run_stats_label = ttk.Label(log_toolbar, text="")
+        self.run_stats_label.pack(side="left", padx=10)
+        ttk.Button(log_toolbar, text=t('log_history'), command=self.open_log_history).pack(side="right")
+        
         self.log_text = scrolledtext.ScrolledText(log_frame, height=8)
         self.log_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.log_view.attach(self.log_text)
+        self.update_run_stats()
     
     def create_progress_area(self):
         """创建专门的进度条区域"""
@@ -308,6 +391,9 @@ class CleanToolsGUI:
             messagebox.showwarning(t("warning"), t("select_rule_first"))
             return
         
+        if self.clean_task and self.clean_task.is_running():
+            return
+        
         try:
             # 重置进度条
             self.reset_progress()
@@ -317,73 +403,169 @@ class CleanToolsGUI:
             # 安全检查
             self.update_progress(10, t("security_check"), t("verifying_rule_integrity"))
             
-            # 检查是否为加密文件且存在安全问题
-            if rule_info.get('is_encrypted', False):
-                if rule_info.get('is_tampered', False) or rule_info.get('cannot_verify', False):
+            # 检查是否为加密文件且存在安全问题（执行前会再验证一次完整性）
+            reason, details = self.core.check_rule_security(rule_info)
+            if reason is not None:
+                if reason == 'tampered':
                     self.show_progress_error(t("security_verification_failed"))
-                    
-                    integrity_status = rule_info.get('integrity_status', 'unknown')
-                    integrity_message = rule_info.get('integrity_message', '')
-                    
-                    if integrity_status == 'tampered':
-                        error_msg = t("security_tampered_error", details=integrity_message)
-                        self.log(f"[{t('security_blocked')}] {t('rule_tampered_detected')}: {self.current_rule} - {integrity_message}")
-                        messagebox.showerror(t("security_error"), error_msg)
-                        return
-                    elif integrity_status in ['cannot_verify', 'error']:
-                        error_msg = t("security_cannot_verify_error", details=integrity_message)
-                        self.log(f"[{t('security_blocked')}] {t('rule_integrity_unverifiable')}: {self.current_rule} - {integrity_message}")
-                        messagebox.showerror(t("security_error"), error_msg)
-                        return
+                    error_msg = t("security_tampered_error", details=details)
+                    self.log(f"[{t('security_blocked')}] {t('rule_tampered_detected')}: {self.current_rule} - {details}")
+                elif reason == 'cannot_verify':
+                    self.show_progress_error(t("security_verification_failed"))
+                    error_msg = t("security_cannot_verify_error", details=details)
+                    self.log(f"[{t('security_blocked')}] {t('rule_integrity_unverifiable')}: {self.current_rule} - {details}")
+                elif reason == 'tampered_before_execution':
+                    self.show_progress_error(t("tampered_before_execution"))
+                    error_msg = t("security_tampered_before_execution", details=details)
+                    self.log(f"[{t('security_blocked')}] {t('rule_tampered_before_execution')}: {self.current_rule} - {details}")
                 else:
-                    # 执行前最后一次验证
-                    rule_dir = rule_info.get('rule_dir')
-                    original_author = rule_info.get('Auther', 'Unknown')
-                    
-                    try:
-                        is_valid, message = self.core.security_manager.verify_integrity(rule_dir, original_author)
-                        if not is_valid:
-                            self.show_progress_error(t("tampered_before_execution"))
-                            error_msg = t("security_tampered_before_execution", details=message)
-                            self.log(f"[{t('security_blocked')}] {t('rule_tampered_before_execution')}: {self.current_rule} - {message}")
-                            messagebox.showerror(t("security_error"), error_msg)
-                            return
-                    except Exception as e:
-                        self.show_progress_error(t("security_verification_failed"))
-                        error_msg = t("security_verification_exception", details=str(e))
-                        self.log(f"[{t('security_blocked')}] {t('security_verification_exception_log')}: {self.current_rule} - {str(e)}")
-                        messagebox.showerror(t("security_error"), error_msg)
-                        return
+                    self.show_progress_error(t("security_verification_failed"))
+                    error_msg = t("security_verification_exception", details=details)
+                    self.log(f"[{t('security_blocked')}] {t('security_verification_exception_log')}: {self.current_rule} - {details}")
+                messagebox.showerror(t("security_error"), error_msg)
+                return
             
             # 记录开始执行的日志
             self.log(f"[{t('security_passed')}] {t('start_executing_verified_rule')}: {self.current_rule}")
             
-            self.clean_btn.config(state="disabled")
-            
             # 执行清理
             self.update_progress(40, t("executing_clean"), t("executing_rule", rule_name=self.current_rule))
             
-            # 执行实际清理，带进度回调
-            success = self.core.execute_clean_rule(
-                rule_info, 
-                self.log_callback,
-                self.update_progress
-            )
+            # 同一规则刚做过预览扫描时，直接按扫描清单删除
+            manifest = None
+            if self.last_scan and self.last_scan['rule'] == self.current_rule:
+                manifest = self.last_scan
+                self.log(t("using_scan_manifest"))
+            self.last_scan = None
             
-            if success:
-                self.show_progress_complete(t("clean_completed", rule_name=self.current_rule))
-                self.log(t("clean_completed", rule_name=self.current_rule))
-                messagebox.showinfo(t("complete"), t("clean_operation_completed"))
-            else:
-                self.show_progress_error(t("clean_process_error"))
-                messagebox.showerror(t("error"), t("clean_process_error"))
+            # 在后台线程中执行实际清理，界面通过事件队列更新
+            self.run_task(CleanTask(self.core, rule_info, manifest=manifest))
                 
         except Exception as e:
             self.show_progress_error(t("clean_failed", error=str(e)))
             self.log(t("clean_failed", error=str(e)))
             messagebox.showerror(t("error"), t("clean_failed", error=str(e)))
-        finally:
-            self.clean_btn.config(state="normal")
+            self.set_task_buttons(False)
+    
+    def start_scan(self):
+        """预览扫描：统计将被删除的文件数和大小，不删除任何文件"""
+        if not self.current_rule:
+            messagebox.showwarning(t("warning"), t("select_rule_first"))
+            return
+        
+        if self.clean_task and self.clean_task.is_running():
+            return
+        
+        self.reset_progress()
+        self.last_scan = None
+        rule_info = self.rules_data[self.current_rule]
+        self.run_task(CleanTask(self.core, rule_info, scan=True))
+    
+    def run_task(self, task):
+        """启动后台任务并开始轮询事件队列"""
+        self.clean_task = task
+        self.clean_task_rule = self.current_rule
+        if not task.scan:
+            self.run_stats = {'files': 0, 'bytes': 0, 'started': time.monotonic(), 'finished': None}
+            self.update_run_stats()
+        self.set_task_buttons(True)
+        task.start()
+        self.root.after(50, self.poll_clean_task)
+    
+    def set_task_buttons(self, running):
+        """根据后台任务状态切换按钮"""
+        self.clean_btn.config(state="disabled" if running else "normal")
+        self.scan_btn.config(state="disabled" if running else "normal")
+        self.cancel_btn.config(state="normal" if running else "disabled")
+    
+    def poll_clean_task(self):
+        """批量处理后台清理任务发来的事件"""
+        task = self.clean_task
+        if task is None:
+            return
+        
+        for event in task.drain():
+            kind = event[0]
+            if kind == 'log':
+                self.log(event[1])
+            elif kind == 'progress':
+                self.update_progress(*event[1:])
+            elif kind == 'scan_target':
+                self.log_scan_target(event[1])
+            elif kind == 'target_done':
+                stats = event[2]
+                self.run_stats['files'] += stats['deleted']
+                self.run_stats['bytes'] += stats['freed']
+                self.update_run_stats()
+            elif kind == 'done':
+                if task.scan:
+                    self.finish_scan(event[1], event[2])
+                else:
+                    self.finish_clean(event[1], event[2])
+                return
+        
+        self.root.after(50, self.poll_clean_task)
+    
+    def log_scan_target(self, entry):
+        """显示单个目标的预览扫描结果"""
+        if entry['kind'] == 'missing':
+            self.log(t("scan_target_missing", target=entry['path']))
+        elif entry['kind'] == 'covered':
+            self.log(t("scan_target_covered", target=entry['target'], line=entry['covered_by']))
+        else:
+            self.log(t("scan_target_result", target=entry['target'],
+                       count=entry['count'], size=format_size(entry['bytes'])))
+    
+    def finish_scan(self, result, cancelled):
+        """预览扫描结束"""
+        self.clean_task = None
+        self.clean_task_rule = None
+        self.set_task_buttons(False)
+        
+        if cancelled or result is None:
+            self.show_progress_error(t("scan_cancelled") if cancelled else t("scan_failed"))
+            return
+        
+        self.last_scan = result
+        summary = t("scan_summary", count=result['total_files'], size=format_size(result['total_bytes']))
+        self.show_progress_complete(summary)
+        self.log(summary)
+    
+    def finish_clean(self, success, cancelled):
+        """后台清理结束"""
+        rule_name = self.clean_task_rule
+        if self.run_stats is not None:
+            self.run_stats['finished'] = time.monotonic()
+            self.update_run_stats()
+        self.clean_task = None
+        self.clean_task_rule = None
+        self.set_task_buttons(False)
+        
+        if cancelled:
+            self.show_progress_error(t("clean_cancelled"))
+            self.log(t("clean_cancelled"))
+        elif success:
+            self.show_progress_complete(t("clean_completed", rule_name=rule_name))
+            self.log(t("clean_completed", rule_name=rule_name))
+            messagebox.showinfo(t("complete"), t("clean_operation_completed"))
+        else:
+            self.show_progress_error(t("clean_process_error"))
+            messagebox.showerror(t("error"), t("clean_process_error"))
+    
+    def cancel_clean(self):
+        """取消正在进行的清理"""
+        if self.clean_task and self.clean_task.is_running():
+            self.clean_task.cancel()
+            self.cancel_btn.config(state="disabled")
+            self.update_progress(self.progress_bar['value'], t("clean_cancelling"))
+    
+    def on_close(self):
+        """关闭主窗口"""
+        if self.clean_task and self.clean_task.is_running():
+            self.clean_task.cancel()
+            self.clean_task.thread.join(timeout=5)
+        self.core.shutdown()
+        self.root.destroy()
     
     def create_new_rule(self):
         """创建新规则"""
@@ -396,7 +578,7 @@ class CleanToolsGUI:
             if rule_path:
                 self.log(t("rule_saved_to", path=rule_path))
                 messagebox.showinfo(t("success"), t("rule_created_success", rule_name=rule_name, path=rule_path))
-                self.load_rules()
+                self.apply_rule_change('changed', Path(rule_path).name)
             else:
                 messagebox.showerror(t("error"), t("save_rule_failed"))
         else:
@@ -422,7 +604,7 @@ class CleanToolsGUI:
             if rule_path:
                 self.log(t("rule_updated", path=rule_path))
                 messagebox.showinfo(t("success"), t("rule_update_success"))
-                self.load_rules()
+                self.apply_rule_change('changed', Path(rule_path).name)
             else:
                 messagebox.showerror(t("error"), t("save_rule_failed"))
     
@@ -455,11 +637,12 @@ class CleanToolsGUI:
             return
         
         if messagebox.askyesno(t("confirm"), t("confirm_delete_rule", rule_name=self.current_rule)):
+            rule_dir = self.rules_data[self.current_rule]['rule_dir']
             if self.core.delete_rule(self.current_rule):
                 self.log(t("rule_deleted", rule_name=self.current_rule))
                 messagebox.showinfo(t("success"), t("rule_delete_success"))
+                self.apply_rule_change('removed', rule_dir.name)
                 self.current_rule = None
-                self.load_rules()
                 self.info_text.config(state="normal")
                 self.info_text.delete(1.0, tk.END)
                 self.info_text.config(state="disabled")
@@ -473,12 +656,46 @@ class CleanToolsGUI:
             filetypes=[(t("compressed_files"), "*.zip"), (t("all_files"), "*.*")]
         )
         
-        if file_path:
-            if self.core.import_rule(file_path):
-                self.log(t("rule_import_success", path=file_path))
-                self.load_rules()
-            else:
-                self.log(t("rule_import_failed", path=file_path))
+        if not file_path:
+            return
+        
+        # 冲突处理方式只询问一次，内容相同的规则自动跳过
+        dialog = ImportPolicyDialog(self.root)
+        self.root.wait_window(dialog.dialog)
+        if dialog.result is None:
+            return
+        
+        result = self.core.import_rule(file_path, dialog.result)
+        if result is not None and result['imported']:
+            self.log(t("rule_import_success", path=file_path))
+            for dir_name in result['imported']:
+                self.apply_rule_change('changed', dir_name)
+        elif result is None or result['failed']:
+            self.log(t("rule_import_failed", path=file_path))
+    
+    def export_rules(self):
+        """把选中的规则（未选中时为全部规则）导出为规则包"""
+        names = [self.rule_listbox.get(index) for index in self.rule_listbox.curselection()]
+        if not names:
+            names = list(self.rules_data.keys())
+        if not names:
+            messagebox.showwarning(t("warning"), t("select_rule_first"))
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            title=t("export_rule_title"),
+            defaultextension=".zip",
+            initialfile="rules.zip",
+            filetypes=[(t("compressed_files"), "*.zip"), (t("all_files"), "*.*")]
+        )
+        if not file_path:
+            return
+        
+        count = self.core.export_rules([self.rules_data[name] for name in names], file_path)
+        if count:
+            self.log(t("rule_export_success", count=count, path=file_path))
+        else:
+            self.log(t("rule_export_failed"))
     
     def on_rule_select(self, event):
         """规则选择事件"""
@@ -486,6 +703,9 @@ class CleanToolsGUI:
         if selection:
             self.current_rule = self.rule_listbox.get(selection[0])
             self.update_rule_info()
+            # 切换规则后之前的预览结果不再适用
+            if self.last_scan and self.last_scan['rule'] != self.current_rule:
+                self.last_scan = None
     
     def update_rule_info(self):
         """更新规则信息显示"""
@@ -514,6 +734,8 @@ class CleanToolsGUI:
                     info_text += f"\n{t('integrity')}: ⚠️ {t('cannot_verify')}"
                     info_text += f"\n{t('execution_status')}: 🚫 {t('execution_prohibited')}"
                     info_text += f"\n{t('details')}: {integrity_message}"
+                elif integrity_status == 'pending':
+                    info_text += f"\n{t('integrity')}: ⏳ {t('verification_pending')}"
                 elif integrity_status == 'error':
                     info_text += f"\n{t('integrity')}: ❌ {t('verification_error')}"
                     info_text += f"\n{t('execution_status')}: 🚫 {t('execution_prohibited')}"
@@ -530,13 +752,108 @@ class CleanToolsGUI:
         
         self.info_text.config(state="disabled")
     
+    def start_loading_rules(self):
+        """加载规则列表，并监视规则目录（只刷新发生变化的规则）"""
+        self.load_rules()
+        self.core.watch_rules(lambda kind, dir_name: self.watch_events.put((kind, dir_name)))
+        self.root.after(300, self.poll_rule_changes)
+    
     def load_rules(self):
-        """加载规则列表"""
+        """加载规则列表（加密规则的完整性在后台进程池中并行验证）"""
         self.rule_listbox.delete(0, tk.END)
-        self.rules_data = self.core.load_rules()
+        self.rules_data = self.core.load_rules(defer_verification=True)
         
         for rule_name in self.rules_data.keys():
             self.rule_listbox.insert(tk.END, rule_name)
+        
+        self.verify_in_background(self.rules_data)
+    
+    def verify_in_background(self, rules_data):
+        """在后台验证待验证的加密规则"""
+        futures = self.core.verify_rules_async(
+            rules_data,
+            lambda rule_name, rule_info: self.verify_events.put((rule_name, rule_info))
+        )
+        if futures and not self.verify_polling:
+            self.verify_polling = True
+            self.root.after(100, self.poll_verification)
+    
+    def poll_rule_changes(self):
+        """处理规则目录监视器发来的事件"""
+        try:
+            while True:
+                kind, dir_name = self.watch_events.get_nowait()
+                self.apply_rule_change(kind, dir_name)
+        except queue.Empty:
+            pass
+        self.root.after(300, self.poll_rule_changes)
+    
+    def apply_rule_change(self, kind, dir_name):
+        """增量更新单个规则目录对应的列表项，只重新验证这一个规则"""
+        old_name = next((name for name, info in self.rules_data.items()
+                         if info['rule_dir'].name == dir_name), None)
+        rule_info = None
+        if kind == 'removed':
+            self.core.unload_rule(self.core.rule_path / dir_name)
+        else:
+            rule_info = self.core.load_rule(self.core.rule_path / dir_name, defer_verification=True)
+        
+        names = list(self.rule_listbox.get(0, tk.END))
+        index = tk.END
+        if old_name is not None:
+            del self.rules_data[old_name]
+            if old_name in names:
+                index = names.index(old_name)
+                self.rule_listbox.delete(index)
+                names.pop(index)
+        
+        if rule_info is None:
+            if old_name is not None and old_name == self.current_rule:
+                self.current_rule = None
+                self.last_scan = None
+                self.update_rule_info()
+            return
+        
+        rule_name = rule_info['Name']
+        self.rules_data[rule_name] = rule_info
+        if rule_name not in names:
+            self.rule_listbox.insert(index, rule_name)
+        
+        if old_name is not None and old_name == self.current_rule:
+            # 保持选中状态（规则可能已改名）
+            self.current_rule = rule_name
+            position = self.rule_listbox.get(0, tk.END).index(rule_name)
+            self.rule_listbox.selection_set(position)
+            self.update_rule_info()
+        elif rule_name == self.current_rule:
+            self.update_rule_info()
+        
+        self.verify_in_background({rule_name: rule_info})
+    
+    def poll_verification(self):
+        """处理后台完整性验证的结果"""
+        try:
+            while True:
+                rule_name, rule_info = self.verify_events.get_nowait()
+                # 规则列表已重新加载时忽略旧的验证结果
+                if self.rules_data.get(rule_name) is rule_info and rule_name == self.current_rule:
+                    self.update_rule_info()
+        except queue.Empty:
+            pass
+        
+        if any(info.get('integrity_status') == 'pending' for info in self.rules_data.values()):
+            self.root.after(100, self.poll_verification)
+        else:
+            self.verify_polling = False
+    
+    def notify(self, level, title, message):
+        """显示核心组件的提示"""
+        if level == 'error':
+            messagebox.showerror(title, message)
+        elif level == 'warning':
+            messagebox.showwarning(title, message)
+        else:
+            messagebox.showinfo(title, message)
     
     def log_callback(self, message):
         """日志回调函数"""
@@ -547,12 +864,28 @@ class CleanToolsGUI:
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         log_message = f"[{timestamp}] {message}\n"
         
-        self.log_text.insert(tk.END, log_message)
-        self.log_text.see(tk.END)
+        # 摘要模式下每个目标的结果（TargetLog）只计入统计，不逐行显示，仍写入日志文件
+        if not (self.summary_mode.get() and isinstance(message, TargetLog)):
+            self.log_view.append(log_message)
         
         # 同时写入日志文件
         self.core.write_log(log_message)
     
+    def update_run_stats(self):
+        """更新本次清理的汇总统计（已删除文件数、释放空间、速度）"""
+        stats = self.run_stats
+        if stats is None:
+            return
+        end = stats['finished'] or time.monotonic()
+        elapsed = max(end - stats['started'], 0.001)
+        self.run_stats_label.config(text=t("log_run_stats", files=stats['files'],
+                                           size=format_size(stats['bytes']),
+                                           rate=f"{stats['files'] / elapsed:.0f}"))
+    
+    def open_log_history(self):
+        """查看日志文件中的历史记录"""
+        LogHistoryDialog(self.root, self.core)
+    
     def open_settings(self):
         """打开设置对话框"""
         dialog = SettingsDialog(self.root, self)
@@ -573,6 +906,91 @@ class CleanToolsGUI:
         dialog = FolderMigrationDialog(self.root)
         self.root.wait_window(dialog.dialog)
 
+class LogHistoryDialog:
+    """日志历史对话框 - 从日志文件末尾开始按页加载更早的记录"""
+    def __init__(self, parent, core, page_size=1000):
+        self.core = core
+        self.page_size = page_size
+        self.history = core.log_store.iter_history()
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(t("log_history"))
+        self.dialog.geometry("800x500")
+        self.dialog.transient(parent)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.close)
+        
+        self.create_widgets()
+        self.load_earlier()
+    
+    def create_widgets(self):
+        """创建日志历史界面"""
+        self.history_text = scrolledtext.ScrolledText(self.dialog)
+        self.history_text.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        button_frame = ttk.Frame(self.dialog)
+        button_frame.pack(fill="x", padx=10, pady=10)
+        
+        self.load_btn = ttk.Button(button_frame, text=t("load_earlier_logs"), command=self.load_earlier)
+        self.load_btn.pack(side="left", padx=5)
+        ttk.Button(button_frame, text=t("close"), command=self.close).pack(side="right", padx=5)
+    
+    def load_earlier(self):
+        """加载更早的一页日志并插入到顶部"""
+        lines = []
+        try:
+            for line in self.history:
+                lines.append(line)
+                if len(lines) >= self.page_size:
+                    break
+        except Exception as e:
+            lines.append(f"{t('log_history_read_failed', error=str(e))}\n")
+        
+        if len(lines) < self.page_size:
+            self.load_btn.config(state="disabled")
+            lines.append(f"{t('log_history_end')}\n")
+        
+        # 第一页滚动到底部（最新的日志），之后的页插入到顶部
+        first_page = self.history_text.index('end-1c') == '1.0'
+        lines.reverse()
+        self.history_text.insert('1.0', ''.join(lines))
+        if first_page:
+            self.history_text.see(tk.END)
+    
+    def close(self):
+        """关闭对话框并释放日志文件"""
+        self.history.close()
+        self.dialog.destroy()
+
+
+class ImportPolicyDialog:
+    """导入规则时选择冲突处理方式"""
+    def __init__(self, parent):
+        self.result = None
+        
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(t("import_policy_title"))
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.geometry("+%d+%d" % (parent.winfo_rootx() + 50, parent.winfo_rooty() + 50))
+        
+        self.policy_var = tk.StringVar(value="skip")
+        
+        ttk.Label(self.dialog, text=t("import_policy_prompt")).pack(anchor="w", padx=10, pady=(10, 5))
+        for policy, key in (("skip", "policy_skip"), ("overwrite", "policy_overwrite"),
+                            ("keep-newer", "policy_keep_newer")):
+            ttk.Radiobutton(self.dialog, text=t(key), variable=self.policy_var,
+                            value=policy).pack(anchor="w", padx=20, pady=2)
+        
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(fill="x", padx=10, pady=10)
+        ttk.Button(btn_frame, text=t("ok"), command=self.confirm).pack(side="right", padx=5)
+        ttk.Button(btn_frame, text=t("cancel"), command=self.dialog.destroy).pack(side="right")
+    
+    def confirm(self):
+        """确认选择"""
+        self.result = self.policy_var.get()
+        self.dialog.destroy()
+
+
 class RuleEditorDialog:
     def __init__(self, parent, title, rule_info=None):
         self.result = None
@@ -749,6 +1167,13 @@ class SettingsDialog:
         other_frame.pack(fill="x", padx=10, pady=10)
         self.ui_components['other_frame'] = other_frame
         
+        # 每次清理开始新的日志分段
+        self.rotate_logs_var = tk.BooleanVar(value=self.main_app.core.log_store.rotate_each_run)
+        rotate_logs_check = ttk.Checkbutton(other_frame, text=t("rotate_logs_each_run"),
+                                            variable=self.rotate_logs_var, command=self.on_rotate_logs_change)
+        rotate_logs_check.pack(anchor="w", padx=10, pady=(10, 0))
+        self.ui_components['rotate_logs_check'] = rotate_logs_check
+        
         # 关于程序按钮
         about_btn = ttk.Button(other_frame, text=t("about_program"), command=self.show_about)
         about_btn.pack(pady=10)
@@ -774,12 +1199,19 @@ class SettingsDialog:
         if 'other_frame' in self.ui_components:
             self.ui_components['other_frame'].config(text=t("other_settings"))
         
+        if 'rotate_logs_check' in self.ui_components:
+            self.ui_components['rotate_logs_check'].config(text=t("rotate_logs_each_run"))
+        
         if 'about_btn' in self.ui_components:
             self.ui_components['about_btn'].config(text=t("about_program"))
         
         if 'close_btn' in self.ui_components:
             self.ui_components['close_btn'].config(text=t("close"))
     
+    def on_rotate_logs_change(self):
+        """切换是否每次清理开始新的日志分段"""
+        self.main_app.core.set_rotate_logs_each_run(self.rotate_logs_var.get())
+    
     def on_language_change(self, event):
         """语言改变事件"""
         selected_display = self.language_var.get()
@@ -907,6 +1339,7 @@ class PageFileManagerDialog:
     
     def check_current_status(self):
         """检查当前页面文件状态"""
+        import subprocess
         try:
             # 使用PowerShell查询页面文件信息
             powershell_cmd = 'Get-WmiObject -Class Win32_PageFileUsage | Select-Object Name, AllocatedBaseSize, CurrentUsage | Format-Table -AutoSize'
@@ -946,6 +1379,7 @@ class PageFileManagerDialog:
 
     def apply_settings(self):
         """应用页面文件设置"""
+        import subprocess
         try:
             drive = self.drive_var.get()
             
@@ -996,6 +1430,7 @@ class PageFileManagerDialog:
 
     def disable_pagefile(self):
         """禁用页面文件"""
+        import subprocess
         if messagebox.askyesno(t("confirm"), t("confirm_disable_pagefile")):
             try:
                 drive = self.drive_var.get()
@@ -1057,6 +1492,7 @@ class HibernateManagerDialog:
     
     def check_hibernate_status(self):
         """检查休眠状态"""
+        import subprocess
         try:
             # 使用powercfg命令查询休眠状态
             result = subprocess.run(["powercfg", "/a"], capture_output=True, text=True, shell=True)
@@ -1075,6 +1511,7 @@ class HibernateManagerDialog:
     
     def enable_hibernate(self):
         """启用休眠"""
+        import subprocess
         try:
             result = subprocess.run(["powercfg", "/hibernate", "on"], 
                                   capture_output=True, text=True, shell=True)
@@ -1090,6 +1527,7 @@ class HibernateManagerDialog:
     
     def disable_hibernate(self):
         """禁用休眠"""
+        import subprocess
         if messagebox.askyesno(t("confirm"), t("confirm_disable_hibernate")):
             try:
                 result = subprocess.run(["powercfg", "/hibernate", "off"], 
@@ -6,29 +6,138 @@ import hashlib
 import hmac
 import secrets
 import struct
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from Crypto.Cipher import AES
-from Crypto.Protocol.KDF import PBKDF2
-from Crypto.Hash import SHA256
-from Crypto.Random import get_random_bytes
+
+# PyCryptodome在第一次加密、解密或生成密钥时才导入，不影响启动速度
+
+HASH_BUFFER_SIZE = 1024 * 1024
+# 多个文件的总大小超过这个值时在线程中并行计算哈希（hashlib计算时会释放GIL）
+PARALLEL_HASH_THRESHOLD = 4 * 1024 * 1024
+
+
+def sha256_file(file_path) -> str:
+    """计算文件SHA-256：优先使用hashlib.file_digest，否则用大缓冲区readinto，避免逐块创建bytes"""
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+        return digest.hexdigest()
+
+
+def sha256_files(file_paths, max_workers=None) -> list:
+    """计算多个文件的SHA-256，按file_paths的顺序返回
+
+    文件较小时逐个计算；总大小超过PARALLEL_HASH_THRESHOLD时在线程池中并行计算。
+    """
+    file_paths = list(file_paths)
+    if len(file_paths) < 2:
+        return [sha256_file(path) for path in file_paths]
+    try:
+        total_size = sum(os.path.getsize(path) for path in file_paths)
+    except OSError:
+        total_size = 0
+    if total_size < PARALLEL_HASH_THRESHOLD:
+        return [sha256_file(path) for path in file_paths]
+    
+    from concurrent.futures import ThreadPoolExecutor
+    workers = max_workers or min(len(file_paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash") as pool:
+        return list(pool.map(sha256_file, file_paths))
+
 
 class SecurityManager:
     """安全管理器 - 处理规则文件的加密和完整性校验"""
     
-    def __init__(self):
+    def __init__(self, blob_store=None):
+        # 规则文件的内容存储（BlobStore），用于直接得到未修改文件的哈希
+        self.blob_store = blob_store
         self.salt_size = 32
         self.key_size = 32  # AES-256
         self.iv_size = 16
         self.tag_size = 16
         self.iterations = 100000
+        
+        # 验证缓存：文件stat未变化时不再重复PBKDF2和哈希计算
+        self.cache_size = 128
+        self._key_cache = OrderedDict()
+        self._verify_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def _cache_put(self, cache, key, value):
+        """写入有界缓存，超出容量时淘汰最久未使用的条目"""
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+    
+    def _cache_get(self, cache, key):
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def cached_result(self, rule_dir: Path, author_name: str):
+        """文件未变化时返回缓存的验证结果，否则返回None（不做任何解密或哈希）"""
+        cached = self._cache_get(self._verify_cache, (str(rule_dir), author_name))
+        if cached is None:
+            return None
+        try:
+            stats = {
+                'rule': self._stat_key(rule_dir / "rule.clean"),
+                'info': self._stat_key(rule_dir / "info.cleantool"),
+                'integrity': self._stat_key(rule_dir / "rule.integrity")
+            }
+        except OSError:
+            return None
+        return cached['result'] if cached['stats'] == stats else None
+    
+    def export_cache_entry(self, rule_dir: Path, author_name: str):
+        """导出验证缓存条目（用于把子进程的验证结果传回主进程）"""
+        return self._cache_get(self._verify_cache, (str(rule_dir), author_name))
+    
+    def import_cache_entry(self, rule_dir: Path, author_name: str, entry: dict):
+        """导入其他进程产生的验证缓存条目"""
+        if entry:
+            self._cache_put(self._verify_cache, (str(rule_dir), author_name), entry)
+    
+    def clear_cache(self, rule_dir: Path = None):
+        """清空验证缓存；指定rule_dir时只移除该规则目录的验证结果（规则被保存、重新加密或删除后）"""
+        with self._cache_lock:
+            if rule_dir is None:
+                self._key_cache.clear()
+                self._verify_cache.clear()
+                return
+            for key in [key for key in self._verify_cache if key[0] == str(rule_dir)]:
+                del self._verify_cache[key]
     
     def generate_key(self, password: str, salt: bytes) -> bytes:
-        """使用PBKDF2生成密钥"""
-        return PBKDF2(password, salt, self.key_size, count=self.iterations, hmac_hash_module=SHA256)
+        """使用PBKDF2生成密钥（相同密码和盐值的结果会被缓存）"""
+        cache_key = (hashlib.sha256(password.encode('utf-8')).digest(), bytes(salt))
+        key = self._cache_get(self._key_cache, cache_key)
+        if key is None:
+            from Crypto.Protocol.KDF import PBKDF2
+            from Crypto.Hash import SHA256
+            key = PBKDF2(password, salt, self.key_size, count=self.iterations, hmac_hash_module=SHA256)
+            self._cache_put(self._key_cache, cache_key, key)
+        return key
     
     def encrypt_data(self, data: bytes, password: str) -> bytes:
         """加密数据"""
         try:
+            from Crypto.Cipher import AES
+            from Crypto.Random import get_random_bytes
+            
             # 生成随机盐值和IV
             salt = get_random_bytes(self.salt_size)
             iv = get_random_bytes(self.iv_size)
@@ -51,6 +160,8 @@ class SecurityManager:
     def decrypt_data(self, encrypted_data: bytes, password: str) -> bytes:
         """解密数据"""
         try:
+            from Crypto.Cipher import AES
+            
             # 提取各部分
             salt = encrypted_data[:self.salt_size]
             iv = encrypted_data[self.salt_size:self.salt_size + self.iv_size]
@@ -72,21 +183,32 @@ class SecurityManager:
     def calculate_file_hash(self, file_path: Path) -> str:
         """计算文件SHA-256哈希"""
         try:
-            sha256_hash = hashlib.sha256()
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(chunk)
-            return sha256_hash.hexdigest()
+            return sha256_file(file_path)
+        except Exception as e:
+            raise Exception(f"计算文件哈希失败: {str(e)}")
+    
+    def file_hashes(self, file_paths: list, use_index: bool = True) -> list:
+        """多个文件的SHA-256哈希：内容存储中未修改的内容文件直接使用其地址，其余文件并行计算
+        
+        use_index为False时不信任内容存储的索引（磁盘上的普通文件），全部直接读取文件计算。
+        """
+        hashes = [None] * len(file_paths)
+        if self.blob_store is not None and use_index:
+            hashes = [self.blob_store.digest_for(path) for path in file_paths]
+        unknown = [index for index, digest in enumerate(hashes) if digest is None]
+        try:
+            for index, digest in zip(unknown, sha256_files([file_paths[i] for i in unknown])):
+                hashes[index] = digest
         except Exception as e:
             raise Exception(f"计算文件哈希失败: {str(e)}")
+        return hashes
     
     def create_integrity_file(self, rule_file_path: Path, info_file_path: Path, 
                             author_name: str) -> Path:
         """创建完整性校验文件"""
         try:
             # 计算文件哈希
-            rule_hash = self.calculate_file_hash(rule_file_path)
-            info_hash = self.calculate_file_hash(info_file_path)
+            rule_hash, info_hash = self.file_hashes([rule_file_path, info_file_path])
             
             # 获取文件大小
             rule_size = rule_file_path.stat().st_size
@@ -125,8 +247,20 @@ class SecurityManager:
         except Exception as e:
             raise Exception(f"创建完整性文件失败: {str(e)}")
     
-    def verify_integrity(self, rule_dir: Path, author_name: str) -> tuple:
-        """验证文件完整性"""
+    @staticmethod
+    def _stat_key(file_path: Path) -> tuple:
+        """文件的stat指纹 (大小, 修改时间)"""
+        st = file_path.stat()
+        return (st.st_size, st.st_mtime_ns)
+    
+    def verify_integrity(self, rule_dir: Path, author_name: str, use_cache: bool = True) -> tuple:
+        """验证文件完整性
+        
+        结果按(规则目录, 作者)缓存：三个文件的大小和修改时间都未变化时直接返回上次结果；
+        只有完整性文件未变化时复用已解密的记录，只重新计算变化文件的哈希。
+        use_cache为False时（执行前的最后检查）不使用验证缓存和内容存储索引：大小和修改时间
+        可以被还原，只有直接读取文件计算的哈希可信。
+        """
         try:
             rule_file = rule_dir / "rule.clean"
             info_file = rule_dir / "info.cleantool"
@@ -136,35 +270,59 @@ class SecurityManager:
             if not all(f.exists() for f in [rule_file, info_file, integrity_file]):
                 return False, "缺少必要文件"
             
-            # 读取完整性文件
-            with open(integrity_file, 'rb') as f:
-                encrypted_data = f.read()
+            cache_key = (str(rule_dir), author_name)
+            stats = {
+                'rule': self._stat_key(rule_file),
+                'info': self._stat_key(info_file),
+                'integrity': self._stat_key(integrity_file)
+            }
+            cached = self._cache_get(self._verify_cache, cache_key) if use_cache else None
+            if cached is not None and cached['stats'] == stats:
+                return cached['result']
             
-            # 解密完整性数据
-            try:
-                json_data = self.decrypt_data(encrypted_data, author_name)
-                import json
-                integrity_data = json.loads(json_data.decode('utf-8'))
-            except:
-                return False, "完整性文件已损坏或密钥错误"
+            # 读取并解密完整性文件（文件未变化时复用已解密的记录）
+            if cached is not None and cached['stats']['integrity'] == stats['integrity']:
+                integrity_data = cached['record']
+            else:
+                with open(integrity_file, 'rb') as f:
+                    encrypted_data = f.read()
+                
+                try:
+                    json_data = self.decrypt_data(encrypted_data, author_name)
+                    import json
+                    integrity_data = json.loads(json_data.decode('utf-8'))
+                except:
+                    return False, "完整性文件已损坏或密钥错误"
+            
+            # 只对stat变化的文件重新计算哈希
+            files = {'rule': rule_file, 'info': info_file}
+            hashes = {}
+            changed = []
+            for name in files:
+                if cached is not None and cached['stats'][name] == stats[name]:
+                    hashes[name] = cached['hashes'][name]
+                else:
+                    changed.append(name)
+            hashes.update(zip(changed, self.file_hashes([files[name] for name in changed], use_index=use_cache)))
             
             # 验证规则文件
-            current_rule_hash = self.calculate_file_hash(rule_file)
-            current_rule_size = rule_file.stat().st_size
-            
-            if (current_rule_hash != integrity_data['rule_file']['hash'] or 
-                current_rule_size != integrity_data['rule_file']['size']):
-                return False, "规则文件已被篡改"
-            
+            if (hashes['rule'] != integrity_data['rule_file']['hash'] or 
+                stats['rule'][0] != integrity_data['rule_file']['size']):
+                result = (False, "规则文件已被篡改")
             # 验证信息文件
-            current_info_hash = self.calculate_file_hash(info_file)
-            current_info_size = info_file.stat().st_size
-            
-            if (current_info_hash != integrity_data['info_file']['hash'] or 
-                current_info_size != integrity_data['info_file']['size']):
-                return False, "信息文件已被篡改"
+            elif (hashes['info'] != integrity_data['info_file']['hash'] or 
+                  stats['info'][0] != integrity_data['info_file']['size']):
+                result = (False, "信息文件已被篡改")
+            else:
+                result = (True, "文件完整性验证通过")
             
-            return True, "文件完整性验证通过"
+            self._cache_put(self._verify_cache, cache_key, {
+                'stats': stats,
+                'record': integrity_data,
+                'hashes': hashes,
+                'result': result
+            })
+            return result
             
         except Exception as e:
             return False, f"验证过程出错: {str(e)}"
@@ -202,8 +360,11 @@ class SecurityManager:
             
             # 保存rule.clean
             rule_file = rule_dir / "rule.clean"
-            with open(rule_file, 'w', encoding='utf-8') as f:
-                f.write(rule_data['rules'])
+            if self.blob_store is not None:
+                self.blob_store.write_text(rule_file, rule_data['rules'])
+            else:
+                with open(rule_file, 'w', encoding='utf-8') as f:
+                    f.write(rule_data['rules'])
             
             # 创建完整性校验文件（使用原始作者名作为密钥）
             self.create_integrity_file(rule_file, info_file, original_author)
@@ -241,4 +402,16 @@ class SecurityManager:
                 else:
                     status['missing_integrity'].append(rule_name)
         
-        return status
\ No newline at end of file
+        return status
+
+
+def verify_rule_worker(rule_dir: str, author_name: str, blob_root: str = None) -> tuple:
+    """进程池中执行的完整性验证，返回(是否有效, 消息, 缓存条目)"""
+    blob_store = None
+    if blob_root is not None:
+        from blob_store import BlobStore
+        blob_store = BlobStore(blob_root)
+    manager = SecurityManager(blob_store)
+    rule_dir = Path(rule_dir)
+    is_valid, message = manager.verify_integrity(rule_dir, author_name)
+    return is_valid, message, manager.export_cache_entry(rule_dir, author_name)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import threading
+from pathlib import Path
+
+CATALOG_FORMAT_VERSION = 1
+FINGERPRINT_FILES = ("info.cleantool", "rule.clean", "rule.integrity")
+
+
+def rule_fingerprint(rule_dir):
+    """规则目录的stat指纹：info.cleantool、rule.clean、rule.integrity的(mtime_ns, size)，不存在为None"""
+    fingerprint = []
+    for name in FINGERPRINT_FILES:
+        try:
+            st = os.stat(os.path.join(rule_dir, name))
+            fingerprint.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return fingerprint
+
+
+class RuleCatalog:
+    """规则目录索引 - 保存每个规则解析后的元数据和stat指纹
+
+    启动时只读取一个索引文件，指纹变化的规则目录才重新解析。
+    索引为JSON Lines格式，每行一个规则目录。
+    """
+
+    def __init__(self, rule_path, index_file, loader):
+        self.rule_path = Path(rule_path)
+        self.index_file = Path(index_file)
+        self.loader = loader
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        """读取索引文件"""
+        entries = {}
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    header = json.loads(f.readline() or '{}')
+                    if header.get('version') == CATALOG_FORMAT_VERSION:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                entries[entry['dir']] = entry
+            except Exception as e:
+                print(f"读取规则索引失败: {e}")
+                entries = {}
+        return entries
+
+    def _ensure_loaded(self):
+        if self._entries is None:
+            self._entries = self._load_index()
+
+    def lookup(self, rule_dir):
+        """获取单个规则目录的元数据，指纹变化时重新解析
+
+        返回元数据字典；目录不是有效规则（缺少info.cleantool）时返回None。
+        """
+        rule_dir = Path(rule_dir)
+        fingerprint = rule_fingerprint(rule_dir)
+        with self._lock:
+            self._ensure_loaded()
+            if fingerprint[0] is None:
+                if self._entries.pop(rule_dir.name, None) is not None:
+                    self._dirty = True
+                return None
+            entry = self._entries.get(rule_dir.name)
+            if entry is not None and entry['fingerprint'] == fingerprint:
+                return entry['metadata']
+
+        metadata = self.loader(rule_dir)
+        with self._lock:
+            self._entries[rule_dir.name] = {
+                'dir': rule_dir.name,
+                'fingerprint': fingerprint,
+                'metadata': metadata
+            }
+            self._dirty = True
+        return metadata
+
+    def scan(self):
+        """遍历规则目录，逐个返回(规则目录, 元数据, 错误)"""
+        seen = set()
+        with os.scandir(self.rule_path) as it:
+            for entry in it:
+                # 以.开头的目录为临时目录（例如导入中的规则）
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                seen.add(entry.name)
+                rule_dir = self.rule_path / entry.name
+                try:
+                    metadata = self.lookup(rule_dir)
+                except Exception as e:
+                    yield rule_dir, None, e
+                    continue
+                if metadata is not None:
+                    yield rule_dir, metadata, None
+
+        # 清理已删除的规则目录
+        with self._lock:
+            self._ensure_loaded()
+            for name in list(self._entries):
+                if name not in seen:
+                    del self._entries[name]
+                    self._dirty = True
+
+    def remove(self, rule_dir):
+        """从索引中移除规则目录"""
+        with self._lock:
+            self._ensure_loaded()
+            if self._entries.pop(Path(rule_dir).name, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """把索引写回磁盘（没有变化时跳过）"""
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            lines = [json.dumps({'version': CATALOG_FORMAT_VERSION}, ensure_ascii=False)]
+            lines.extend(json.dumps(entry, ensure_ascii=False) for entry in self._entries.values())
+            self._dirty = False
+        try:
+            self.index_file.parent.mkdir(exist_ok=True)
+            temp_file = self.index_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(temp_file, self.index_file)
+        except Exception as e:
+            print(f"保存规则索引失败: {e}")
+
+
+class _WatchdogHandler:
+    """把watchdog事件转换为发生变化的规则目录名"""
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def dispatch(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path:
+                self.watcher.mark_dirty(path)
+
+
+class RuleWatcher:
+    """规则目录监视器 - 按规则目录发出('added'|'changed'|'removed', 目录名)事件
+
+    有watchdog时只重新检查收到通知的规则目录；没有时每隔interval秒轮询全部规则目录的
+    stat指纹。callback在后台线程中调用。
+    """
+
+    def __init__(self, rule_path, callback, interval=2.0, debounce=0.3):
+        self.rule_path = Path(rule_path)
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self._snapshot = {}
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+
+    def _take_snapshot(self, names=None):
+        """计算规则目录的指纹，names为None时检查全部目录"""
+        snapshot = {}
+        if names is None:
+            try:
+                with os.scandir(self.rule_path) as it:
+                    names = [entry.name for entry in it
+                             if entry.is_dir() and not entry.name.startswith('.')]
+            except OSError:
+                names = []
+        for name in names:
+            fingerprint = rule_fingerprint(self.rule_path / name)
+            if fingerprint[0] is not None:
+                snapshot[name] = fingerprint
+        return snapshot
+
+    def start(self):
+        """开始监视"""
+        self._snapshot = self._take_snapshot()
+        try:
+            # 可选依赖：安装watchdog后使用系统文件通知（inotify/ReadDirectoryChangesW），否则轮询；
+            # 在这里才导入，不影响启动速度
+            from watchdog.observers import Observer
+        except ImportError:
+            Observer = None
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_WatchdogHandler(self), str(self.rule_path), recursive=True)
+                self._observer.start()
+            except Exception as e:
+                print(f"文件通知不可用，改为轮询: {e}")
+                self._observer = None
+        self._thread = threading.Thread(target=self._run, name="rule-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监视"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=2)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def mark_dirty(self, path):
+        """记录发生变化的规则目录（由文件通知调用）"""
+        try:
+            relative = Path(path).relative_to(self.rule_path)
+        except ValueError:
+            return
+        if not relative.parts or relative.parts[0].startswith('.'):
+            return
+        with self._dirty_lock:
+            self._dirty.add(relative.parts[0])
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._observer is not None:
+                self._wakeup.wait()
+                # 合并短时间内的连续通知
+                self._stop.wait(self.debounce)
+                self._wakeup.clear()
+                with self._dirty_lock:
+                    names = self._dirty
+                    self._dirty = set()
+            else:
+                self._stop.wait(self.interval)
+                names = None
+            if self._stop.is_set():
+                break
+            self._check(names)
+
+    def _check(self, names):
+        """比较指纹并发出事件"""
+        current = self._take_snapshot(names)
+        candidates = set(current) | (set(self._snapshot) if names is None else set(names))
+        for name in sorted(candidates):
+            old = self._snapshot.get(name)
+            new = current.get(name)
+            if old == new:
+                continue
+            if new is None:
+                del self._snapshot[name]
+                kind = 'removed'
+            else:
+                self._snapshot[name] = new
+                kind = 'added' if old is None else 'changed'
+            try:
+                self.callback(kind, name)
+            except Exception as e:
+                print(f"处理规则变化失败 {name}: {e}")
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from clean_engine import FileFilter
+
+CACHE_FORMAT_VERSION = 5
+
+# cl行的删除方式：只删除文件 / 删除文件后删除变空的子目录 / 删除整个目录
+CLEAN_MODES = ('files', 'prune', 'tree')
+
+# system行的默认超时（秒），system[timeout=none]不限时间
+DEFAULT_COMMAND_TIMEOUT = 30
+
+# 选项的单位：older=30d（不写单位时为天），larger=10M（不写单位时为字节），timeout=10m（不写单位时为秒）
+_TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+_SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2,
+               'g': 1024 ** 3, 'gb': 1024 ** 3, 't': 1024 ** 4, 'tb': 1024 ** 4}
+_QUANTITY = re.compile(r'^(\d+(?:\.\d+)?)\s*([a-z]*)$')
+
+# 规则行格式：cl 路径、cl[选项] 路径、system[选项] 命令
+_OPERATION_LINE = re.compile(r'^(cl|system)(?:\[([^\]]*)\])?\s+(\S.*)$')
+
+
+def parse_options(text):
+    """解析方括号中的选项，例如"prune"或"mode=prune, x=1"，返回{名称: 值}，开关选项的值为True"""
+    options = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, separator, value = item.partition('=')
+        name = name.strip().lower()
+        if not name:
+            raise ValueError(f"无效的选项: {item}")
+        options[name] = value.strip() if separator else True
+    return options
+
+
+def _quantity(name, value, units, default_unit):
+    """解析带单位的数值选项，例如30d、10M"""
+    if value is True:
+        raise ValueError(f"选项{name}需要一个值")
+    match = _QUANTITY.match(value.strip().lower())
+    if match is None or (match.group(2) or default_unit) not in units:
+        raise ValueError(f"无效的{name}: {value}")
+    return float(match.group(1)) * units[match.group(2) or default_unit]
+
+
+def _patterns(name, value):
+    """解析以|分隔的通配符列表"""
+    if value is True:
+        raise ValueError(f"选项{name}需要一个值")
+    patterns = [pattern.strip() for pattern in value.split('|') if pattern.strip()]
+    if not patterns:
+        raise ValueError(f"无效的{name}: {value}")
+    return patterns
+
+
+def build_file_filter(options):
+    """由cl行的选项创建FileFilter，没有过滤选项时返回None"""
+    if not any(name in options for name in ('older', 'larger', 'include', 'exclude')):
+        return None
+    return FileFilter(
+        older_than=_quantity('older', options['older'], _TIME_UNITS, 'd') if 'older' in options else None,
+        larger_than=_quantity('larger', options['larger'], _SIZE_UNITS, '') if 'larger' in options else None,
+        include=_patterns('include', options['include']) if 'include' in options else (),
+        exclude=_patterns('exclude', options['exclude']) if 'exclude' in options else (),
+    )
+
+
+class RuleOperation:
+    """规则操作基类"""
+    __slots__ = ('line_no', 'line')
+    kind = 'unknown'
+    # 支持的选项名称
+    OPTIONS = frozenset()
+
+    def __init__(self, line_no, line):
+        self.line_no = line_no
+        self.line = line
+
+    def _check_options(self, options):
+        """不支持的选项抛出ValueError（该行按无法识别的规则处理）"""
+        unknown = set(options) - self.OPTIONS
+        if unknown:
+            raise ValueError(f"未知选项: {', '.join(sorted(unknown))}")
+
+    @property
+    def argument(self):
+        return self.line
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.line_no}, {self.line!r})"
+
+
+class CleanOperation(RuleOperation):
+    """cl 行 - 清理路径
+
+    删除方式写作cl[prune] 路径或cl[mode=prune] 路径：files只删除文件、保留目录结构（默认），
+    prune删除文件后删除变空的子目录，tree删除整个目录（包括目录本身）。
+    过滤选项older=30d、larger=10M、include=*.tmp|*.log、exclude=*.keep只删除符合条件的文件。
+    """
+    __slots__ = ('path', 'options', 'mode', 'file_filter')
+    kind = 'cl'
+    OPTIONS = frozenset({'mode', 'older', 'larger', 'include', 'exclude'})
+
+    def __init__(self, line_no, line, path, options=None):
+        super().__init__(line_no, line)
+        self.path = path
+        options = dict(options or {})
+        for mode in CLEAN_MODES:
+            if options.get(mode) is True:
+                del options[mode]
+                options.setdefault('mode', mode)
+        self._check_options(options)
+        self.mode = options.get('mode', 'files')
+        if self.mode not in CLEAN_MODES:
+            raise ValueError(f"未知的删除方式: {self.mode}")
+        if self.mode == 'tree' and any(name != 'mode' for name in options):
+            raise ValueError("tree方式删除整个目录，不能与过滤选项同时使用")
+        self.file_filter = build_file_filter(options)
+        self.options = options
+
+    @property
+    def argument(self):
+        return self.path
+
+
+class SystemOperation(RuleOperation):
+    """system 行 - 执行系统命令
+
+    system[parallel] 命令：与相邻的parallel命令互不依赖，可以同时执行。
+    system[timeout=600] 命令：超时时间（默认30秒，可以写10m、2h），timeout=none不限时间。
+    """
+    __slots__ = ('command', 'options', 'parallel', 'timeout')
+    kind = 'system'
+    OPTIONS = frozenset({'parallel', 'timeout'})
+
+    def __init__(self, line_no, line, command, options=None):
+        super().__init__(line_no, line)
+        self.command = command
+        options = dict(options or {})
+        self._check_options(options)
+        if options.get('parallel', True) is not True:
+            raise ValueError("选项parallel不需要值")
+        self.parallel = 'parallel' in options
+        self.timeout = DEFAULT_COMMAND_TIMEOUT
+        if 'timeout' in options:
+            value = options['timeout']
+            if value is not True and value.strip().lower() in ('none', 'off'):
+                self.timeout = None
+            else:
+                self.timeout = _quantity('timeout', value, _TIME_UNITS, 's')
+                if self.timeout <= 0:
+                    raise ValueError(f"无效的timeout: {value}")
+        self.options = options
+
+    @property
+    def argument(self):
+        return self.command
+
+
+class UnknownOperation(RuleOperation):
+    """无法识别的规则行"""
+    __slots__ = ()
+    kind = 'unknown'
+
+    @property
+    def options(self):
+        return {}
+
+
+OPERATION_TYPES = {
+    'cl': CleanOperation,
+    'system': SystemOperation,
+    'unknown': UnknownOperation,
+}
+
+
+def compile_line(line_no, line):
+    """编译单行规则，注释和空行返回None"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    match = _OPERATION_LINE.match(line)
+    if match is None:
+        return UnknownOperation(line_no, line)
+    kind, option_text, argument = match.groups()
+    try:
+        options = parse_options(option_text) if option_text is not None else {}
+        return OPERATION_TYPES[kind](line_no, line, argument.strip(), options)
+    except ValueError:
+        return UnknownOperation(line_no, line)
+
+
+class CompiledRule:
+    """编译后的规则 - 规则文件只解析一次，执行、预览和显示共用"""
+    __slots__ = ('source', 'fingerprint', 'digest', 'text', 'operations')
+
+    def __init__(self, source, fingerprint, digest, text, operations):
+        self.source = source
+        self.fingerprint = fingerprint
+        self.digest = digest
+        self.text = text
+        self.operations = operations
+
+    @classmethod
+    def from_text(cls, text, source=None, fingerprint=None, digest=None):
+        """从规则文本编译"""
+        if digest is None:
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        operations = []
+        for line_no, line in enumerate(text.splitlines(), 1):
+            operation = compile_line(line_no, line)
+            if operation is not None:
+                operations.append(operation)
+        return cls(source, fingerprint, digest, text, operations)
+
+    def to_dict(self):
+        """序列化为可写入JSON的字典"""
+        return {
+            'fingerprint': list(self.fingerprint) if self.fingerprint else None,
+            'digest': self.digest,
+            'text': self.text,
+            'operations': [
+                [op.kind, op.line_no, op.line, op.argument, op.options] for op in self.operations
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, source, data):
+        """从字典恢复，不重新解析规则文本"""
+        operations = []
+        for kind, line_no, line, argument, options in data['operations']:
+            op_type = OPERATION_TYPES[kind]
+            if op_type is UnknownOperation:
+                operations.append(op_type(line_no, line))
+            else:
+                operations.append(op_type(line_no, line, argument, options))
+        fingerprint = tuple(data['fingerprint']) if data.get('fingerprint') else None
+        return cls(source, fingerprint, data['digest'], data['text'], operations)
+
+
+def file_fingerprint(path):
+    """文件的stat指纹 (mtime_ns, size)"""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class RuleCache:
+    """编译规则缓存 - 以文件mtime/大小/内容哈希为键，可持久化到缓存文件"""
+
+    def __init__(self, cache_file=None, max_entries=512):
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # 本进程内编译过的规则；从缓存文件读出的条目在执行前必须重新编译
+        self._trusted = set()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._loaded = False
+
+    def _load(self):
+        """首次使用时读取缓存文件"""
+        self._loaded = True
+        if not self.cache_file or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CACHE_FORMAT_VERSION:
+                return
+            for source, entry in data.get('rules', {}).items():
+                self._entries[source] = CompiledRule.from_dict(source, entry)
+        except Exception as e:
+            print(f"读取规则缓存失败: {e}")
+            self._entries.clear()
+
+    def get(self, rule_file, verify=False):
+        """获取编译后的规则
+
+        stat指纹未变化时直接返回缓存；verify=True时还会读取文件并比对内容
+        哈希（执行前使用，防止缓存文件被篡改）。
+        """
+        source = str(Path(rule_file).resolve())
+        fingerprint = file_fingerprint(rule_file)
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            compiled = self._entries.get(source)
+            if compiled is not None:
+                self._entries.move_to_end(source)
+            if compiled is not None and compiled.fingerprint == fingerprint and not verify:
+                return compiled
+
+        with open(rule_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+        if compiled is not None and source not in self._trusted:
+            # 缓存文件中读出的条目只在stat未变化时用于显示，不沿用其解析结果
+            compiled = None
+
+        if compiled is not None and compiled.digest == digest:
+            # 内容未变（例如只是mtime被更新），沿用已解析的操作列表
+            if compiled.fingerprint == fingerprint:
+                return compiled
+            compiled = CompiledRule(source, fingerprint, digest, text, compiled.operations)
+        else:
+            compiled = CompiledRule.from_text(text, source, fingerprint, digest)
+
+        with self._lock:
+            self._entries[source] = compiled
+            self._entries.move_to_end(source)
+            self._trusted.add(source)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._trusted.discard(evicted)
+            self._dirty = True
+        return compiled
+
+    def invalidate(self, rule_file):
+        """移除指定规则的缓存"""
+        source = str(Path(rule_file).resolve())
+        with self._lock:
+            self._trusted.discard(source)
+            if self._entries.pop(source, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """将缓存写入缓存文件（没有变化时跳过）"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                'version': CACHE_FORMAT_VERSION,
+                'rules': {source: compiled.to_dict() for source, compiled in self._entries.items()},
+            }
+            self._dirty = False
+        try:
+            self.cache_file.parent.mkdir(exist_ok=True)
+            temp_file = self.cache_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            print(f"保存规则缓存失败: {e}")
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+import zipfile
+import datetime
+from pathlib import Path, PurePosixPath
+
+from blob_store import remove_tree
+from pass_module import sha256_files
+
+REQUIRED_FILES = ("info.cleantool", "rule.clean")
+
+MANIFEST_NAME = "manifest.json"
+PACK_FORMAT = "cleantools-rule-pack"
+PACK_FORMAT_VERSION = 1
+CONFLICT_POLICIES = ("skip", "overwrite", "keep-newer")
+CHUNK_SIZE = 1024 * 1024
+
+
+class ArchiveError(Exception):
+    """规则压缩包格式错误"""
+
+
+def _member_parts(name):
+    """拆分压缩包成员路径，拒绝绝对路径和..等可能写到规则目录之外的路径"""
+    name = name.replace('\\', '/')
+    path = PurePosixPath(name)
+    if path.is_absolute() or (path.parts and ':' in path.parts[0]):
+        raise ArchiveError(f"不安全的路径: {name}")
+    parts = [part for part in path.parts if part not in ('', '.')]
+    if any(part == '..' for part in parts):
+        raise ArchiveError(f"不安全的路径: {name}")
+    return parts
+
+
+def scan_archive(zip_ref):
+    """只读取中央目录，找出包含info.cleantool和rule.clean的顶层规则目录
+
+    返回{规则目录名: [(成员信息, 目录内的相对路径)]}，不解压任何内容。
+    """
+    folders = {}
+    for info in zip_ref.infolist():
+        parts = _member_parts(info.filename)
+        if len(parts) < 2 or parts[0].startswith('.'):
+            continue
+        members = folders.setdefault(parts[0], [])
+        if not info.is_dir():
+            members.append((info, parts[1:]))
+
+    valid = {}
+    for folder, members in folders.items():
+        top_level = {tuple(relative) for _, relative in members}
+        if all((name,) in top_level for name in REQUIRED_FILES):
+            valid[folder] = members
+    return valid
+
+
+def stage_rule(zip_ref, folder, members, rule_path, expected_hashes=None):
+    """把一个规则目录的成员直接流式写入规则目录下的临时目录（以.开头，不会被加载）
+
+    expected_hashes为{相对路径: sha256}时边写入边校验，文件列表或内容不一致时抛出ArchiveError。
+    """
+    staging = Path(rule_path) / f".{folder}.importing-{uuid.uuid4().hex[:8]}"
+    staging.mkdir()
+    try:
+        written = set()
+        for info, relative in members:
+            name = '/'.join(relative)
+            if expected_hashes is not None and name not in expected_hashes:
+                raise ArchiveError(f"清单中没有的文件: {folder}/{name}")
+            target = staging.joinpath(*relative)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            with zip_ref.open(info) as source, open(target, 'wb') as output:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    output.write(chunk)
+            if expected_hashes is not None and digest.hexdigest() != expected_hashes[name]:
+                raise ArchiveError(f"文件校验失败: {folder}/{name}")
+            written.add(name)
+        if expected_hashes is not None and written != set(expected_hashes):
+            missing = sorted(set(expected_hashes) - written)
+            raise ArchiveError(f"缺少清单中的文件: {folder}/{missing[0]}")
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return staging
+
+
+def install_directory(staging, target_dir):
+    """用改名把临时目录安装为规则目录；已存在的规则目录先改名移开，失败时恢复"""
+    target_dir = Path(target_dir)
+    backup = None
+    if target_dir.exists():
+        backup = target_dir.with_name(f".{target_dir.name}.replaced-{uuid.uuid4().hex[:8]}")
+        os.replace(target_dir, backup)
+    try:
+        os.replace(staging, target_dir)
+    except BaseException:
+        if backup is not None:
+            os.replace(backup, target_dir)
+        raise
+    if backup is not None:
+        remove_tree(backup, ignore_errors=True)
+
+
+def rule_files(rule_dir):
+    """规则目录中的所有文件 [(相对路径, 绝对路径)]，按相对路径排序"""
+    rule_dir = Path(rule_dir)
+    files = []
+    for root, dirs, names in os.walk(rule_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in names:
+            path = Path(root) / name
+            files.append((path.relative_to(rule_dir).as_posix(), path))
+    return sorted(files)
+
+
+def rule_hash(file_hashes):
+    """规则目录的内容哈希：由每个文件的相对路径和SHA-256计算，与修改时间无关"""
+    digest = hashlib.sha256()
+    for name in sorted(file_hashes):
+        digest.update(f"{name}\0{file_hashes[name]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def local_rule_hash(rule_dir):
+    """已安装规则目录的内容哈希"""
+    files = rule_files(rule_dir)
+    return rule_hash(dict(zip((name for name, _ in files), sha256_files(path for _, path in files))))
+
+
+def version_key(version):
+    """把版本号转换为可比较的元组，例如1.10比1.9新"""
+    return tuple(int(number) for number in re.findall(r'\d+', str(version or '')))
+
+
+def read_manifest(zip_ref):
+    """读取规则包清单，普通zip（没有清单）返回None"""
+    try:
+        info = zip_ref.getinfo(MANIFEST_NAME)
+    except KeyError:
+        return None
+    with zip_ref.open(info) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != PACK_FORMAT or manifest.get('version', 0) > PACK_FORMAT_VERSION:
+        raise ArchiveError("不支持的规则包格式")
+    return {entry['dir']: entry for entry in manifest.get('rules', [])}
+
+
+def export_pack(rules, output_file):
+    """导出规则包
+
+    rules为[(规则目录, 名称, 版本)]。文件边压缩边计算哈希，最后写入manifest.json。
+    返回写入清单的规则条目列表。
+    """
+    entries = []
+    temp_file = Path(f"{output_file}.tmp")
+    with zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for rule_dir, name, version in rules:
+            rule_dir = Path(rule_dir)
+            file_hashes = {}
+            newest = 0
+            for relative, path in rule_files(rule_dir):
+                info = zipfile.ZipInfo.from_file(path, f"{rule_dir.name}/{relative}")
+                info.compress_type = zipfile.ZIP_DEFLATED
+                digest = hashlib.sha256()
+                with open(path, 'rb') as source, zip_ref.open(info, 'w') as target:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        target.write(chunk)
+                file_hashes[relative] = digest.hexdigest()
+                newest = max(newest, int(path.stat().st_mtime))
+            entries.append({
+                'dir': rule_dir.name,
+                'name': name,
+                'version': version,
+                'hash': rule_hash(file_hashes),
+                'mtime': newest,
+                'files': file_hashes
+            })
+        manifest = {
+            'format': PACK_FORMAT,
+            'version': PACK_FORMAT_VERSION,
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'rules': entries
+        }
+        zip_ref.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    os.replace(temp_file, output_file)
+    return entries
+
+
+def _pack_is_newer(entry, target_dir, local_version):
+    """keep-newer策略：先比较版本号，版本相同时比较文件修改时间"""
+    pack_version = version_key(entry.get('version'))
+    installed_version = version_key(local_version(target_dir) if local_version else None)
+    if pack_version != installed_version:
+        return pack_version > installed_version
+    installed_mtime = max((int(path.stat().st_mtime) for _, path in rule_files(target_dir)), default=0)
+    return entry.get('mtime', 0) > installed_mtime
+
+
+def import_pack(file_path, rule_path, policy="skip", local_version=None):
+    """导入规则包或普通规则压缩包
+
+    先检查中央目录，只解压有效的规则目录。规则已存在时：内容哈希相同则不做任何操作，
+    否则按policy处理：skip跳过、overwrite覆盖、keep-newer只在包中版本更新时覆盖
+    （local_version(规则目录)返回已安装规则的版本号）。没有清单的普通zip无法比较哈希。
+
+    返回{'imported': [...], 'unchanged': [...], 'skipped': [...], 'failed': [(目录名, 错误)]}。
+    """
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError(f"未知的冲突策略: {policy}")
+    rule_path = Path(rule_path)
+    result = {'imported': [], 'unchanged': [], 'skipped': [], 'failed': []}
+
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        manifest = read_manifest(zip_ref)
+        for folder, members in scan_archive(zip_ref).items():
+            entry = manifest.get(folder) if manifest is not None else None
+            if manifest is not None and entry is None:
+                result['failed'].append((folder, "规则不在清单中"))
+                continue
+            target_dir = rule_path / folder
+            try:
+                if target_dir.exists():
+                    if entry is not None and local_rule_hash(target_dir) == entry['hash']:
+                        result['unchanged'].append(folder)
+                        continue
+                    if policy == "skip" or (policy == "keep-newer" and (
+                            entry is None or not _pack_is_newer(entry, target_dir, local_version))):
+                        result['skipped'].append(folder)
+                        continue
+
+                staging = stage_rule(zip_ref, folder, members, rule_path,
+                                     entry['files'] if entry is not None else None)
+                try:
+                    install_directory(staging, target_dir)
+                except BaseException:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+                result['imported'].append(folder)
+            except (OSError, ArchiveError, zipfile.BadZipFile) as e:
+                result['failed'].append((folder, str(e)))
+    return result
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+JOURNAL_FORMAT_VERSION = 1
+# mtime距记录时间太近的目录不记录：文件系统时间精度内之后的修改可能不会改变mtime
+RACY_WINDOW_NS = 2 * 1000 ** 3
+# 日志文件每次使用都会重写：超过这么久未使用（通配符不再匹配或已从规则中删除）的目标日志被删除
+JOURNAL_MAX_AGE = 30 * 86400
+# 最多保留的目标日志数，超出时删除最久未使用的
+JOURNAL_MAX_FILES = 1000
+
+
+class DirectoryJournal:
+    """单个清理目标的目录日志 - 记录上次遍历时没有文件的目录的mtime和子目录
+
+    目录中创建、删除或改名条目都会改变目录自身的mtime，所以mtime未变化且上次没有文件
+    的目录现在仍然没有文件，不必再scandir，只需继续检查记录的子目录（子目录中的变化
+    不会反映到父目录的mtime上）。每次遍历只保留本次确认过的目录。
+    """
+
+    def __init__(self, journal_file, root, entries):
+        self.journal_file = journal_file
+        self.root = os.fspath(root)
+        self._previous = entries
+        self._current = {}
+        self._started_ns = time.time_ns()
+
+    def _relative(self, path):
+        return path[len(self.root):]
+
+    def unchanged_subdirs(self, path, mtime_ns):
+        """目录mtime与记录相同时返回记录的子目录路径列表，否则返回None（需要扫描）"""
+        relative = self._relative(path)
+        entry = self._previous.get(relative)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        self._current[relative] = entry
+        return [os.path.join(path, name) for name in entry[1]]
+
+    def record(self, path, mtime_ns, subdirs):
+        """记录扫描时没有文件的目录（mtime为扫描前取得的值）"""
+        if mtime_ns >= self._started_ns - RACY_WINDOW_NS:
+            return
+        self._current[self._relative(path)] = [mtime_ns, [os.path.basename(subdir) for subdir in subdirs]]
+
+    def save(self):
+        """写回日志文件"""
+        try:
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_file = self.journal_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'version': JOURNAL_FORMAT_VERSION, 'target': self.root, 'dirs': self._current},
+                          f, ensure_ascii=False)
+            os.replace(temp_file, self.journal_file)
+        except Exception as e:
+            print(f"保存目录日志失败: {e}")
+
+
+class TargetJournal:
+    """按清理目标保存目录日志，每个目标一个文件；prune删除不再使用的日志"""
+
+    def __init__(self, journal_path):
+        self.journal_path = Path(journal_path)
+
+    def _journal_file(self, target):
+        key = os.path.normcase(os.path.abspath(target))
+        return self.journal_path / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]}.json"
+
+    def open(self, target):
+        """读取目标的目录日志，返回DirectoryJournal"""
+        target = os.fspath(target)
+        journal_file = self._journal_file(target)
+        entries = {}
+        if journal_file.exists():
+            try:
+                with open(journal_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == JOURNAL_FORMAT_VERSION and data.get('target') == target:
+                    entries = data.get('dirs', {})
+            except Exception as e:
+                print(f"读取目录日志失败: {e}")
+        return DirectoryJournal(journal_file, target, entries)
+
+    def prune(self, max_age=JOURNAL_MAX_AGE, max_files=JOURNAL_MAX_FILES):
+        """删除超过max_age秒未使用的目标日志，并只保留最近使用的max_files个，返回删除的文件数"""
+        try:
+            journals = []
+            with os.scandir(self.journal_path) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(('.json', '.tmp')):
+                        journals.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            return 0
+        journals.sort(reverse=True)
+        cutoff = time.time() - max_age
+        removed = 0
+        for index, (mtime, path) in enumerate(journals):
+            if index < max_files and mtime >= cutoff:
+                continue
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed